@@ -1,4 +1,5 @@
 from typing import Type, TypeAlias, TypeVar
+from weakref import WeakKeyDictionary
 
 import ujson
 
@@ -36,7 +37,21 @@ DRFModel = TypeVar('DRFModel', bound=BaseSerializer)
 Form: TypeAlias = PydanticModel | DRFModel
 
 
+# Leaves that are returned as is. Exact types only: Missing is a str subclass
+_SCALARS = frozenset((str, int, float, bool, bytes, type(None)))
+
+
 def without_missing(obj) -> Json | None:
+    # Fast path for plain JSON trees: leaves are passed through without a recursive call
+    obj_type = type(obj)
+    if obj_type in _SCALARS:
+        return obj
+    if obj_type is dict:
+        return {k: v if type(v) in _SCALARS else without_missing(v)
+                for k, v in obj.items() if not isinstance(v, Missing)}
+    if obj_type is list:
+        return [i if type(i) in _SCALARS else without_missing(i) for i in obj if not isinstance(i, Missing)]
+
     if _items := getattr(obj, 'items', None):
         return {k: without_missing(v) for k, v in _items() if not isinstance(v, Missing)}
     if isinstance(obj, (list, set, tuple)):
@@ -88,12 +103,8 @@ class Pydantic:
 
         if plain:
             assert isinstance(data, s)
-        elif isinstance(data, (QuerySet, Model)):
-            s.model_config['from_attributes'] = True
-            data = s.model_validate(data)
         else:
-            s.model_config['from_attributes'] = False
-            data = s.model_validate(data)
+            data = s.model_validate(data, from_attributes=isinstance(data, (QuerySet, Model)))
         return data.model_dump()
 
     @classmethod
@@ -103,25 +114,31 @@ class Pydantic:
 
         if plain:
             assert isinstance(data, s)
-        elif isinstance(data, (QuerySet, Model)):
-            s.model_config['from_attributes'] = True
-            data = s.model_validate(data)
         else:
-            s.model_config['from_attributes'] = False
-            data = s.model_validate(data)
+            data = s.model_validate(data, from_attributes=isinstance(data, (QuerySet, Model)))
         res = data.model_dump_json()
         if isinstance(res, bytes):
             return res
         return res.encode('utf-8')
 
 
+# Scheme class -> its adapter. Weak keys, so dynamically created schemes can still be collected
+_scheme_types: WeakKeyDictionary[type, Type[DRF] | Type[Pydantic]] = WeakKeyDictionary()
+
+
 def _resolve_scheme_type(scheme: Scheme) -> Type[DRF] | Type[Pydantic]:
+    try:
+        return _scheme_types[scheme]
+    except KeyError:
+        pass
     if issubclass(scheme, BaseSerializer):
-        return DRF
+        res = DRF
     elif issubclass(scheme, BaseModel):
-        return Pydantic
+        res = Pydantic
     else:
         raise UnsupportedSchemeError('Unsupported scheme', scheme=scheme)
+    _scheme_types[scheme] = res
+    return res
 
 
 def scheme_load(scheme: Scheme, data: Json, *, many: bool = False, plain: bool = False) -> Json | Form:
@@ -1,5 +1,4 @@
 import asyncio
-import inspect
 
 from cats.v2 import Config
 from cats.v2.action import Action
@@ -21,10 +20,7 @@ class Connection(BaseConn):
 
     async def handle_broadcast(self, action: Action):
         if action.handler_id in self.subscriptions:
-            for fn in self.subscriptions[action.handler_id].values():
-                res = fn(action)
-                if inspect.isawaitable(res):
-                    await res
+            await self.notify_subscribers(action)
             if not self.store_handled_broadcast:
                 return
         self.broadcast_inbox.append(action)
@@ -45,7 +41,7 @@ class Connection(BaseConn):
             if not self.store_handled_broadcast:
                 self.broadcast_inbox.pop(i)
             return action
-        fut = asyncio.Future()
+        fut = self._loop.create_future()
         sub_id = self.subscribe(handler_id, lambda res: fut.set_result(res))
         response = await asyncio.wait_for(fut, 5.0)
         self.unsubscribe(handler_id, sub_id)
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pathlib import Path
 from types import GeneratorType
 from typing import AsyncIterable, Iterable, TypeAlias
@@ -6,6 +7,11 @@ import ujson
 
 from cats.errors import MalformedHeadersError
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 try:
     from django.db.models import QuerySet, Model
 except ImportError:
@@ -59,6 +65,11 @@ class Missing(str):
 MISSING = Missing()
 
 
+@lru_cache(maxsize=1024)
+def _normalize_header_key(key: str) -> str:
+    return key.replace(' ', '-').title()
+
+
 class Headers(dict):
     __slots__ = ()
 
@@ -68,39 +79,60 @@ class Headers(dict):
             raise MalformedHeadersError('Invalid offset header', headers=v)
         super().__init__(v)
 
-    @classmethod
-    def _key(cls, key: str) -> str:
-        return key.replace(' ', '-').title()
-
     def __getitem__(self, item):
-        return super().__getitem__(self._key(item))
+        try:
+            return super().__getitem__(item)
+        except KeyError:
+            return super().__getitem__(_normalize_header_key(item))
 
     def __setitem__(self, key, value):
-        return super().__setitem__(self._key(key), value)
+        return super().__setitem__(_normalize_header_key(key), value)
 
     def __delitem__(self, key):
-        return super().__delitem__(self._key(key))
+        return super().__delitem__(_normalize_header_key(key))
 
     def __contains__(self, item):
-        return super().__contains__(self._key(item))
+        return super().__contains__(_normalize_header_key(item))
 
     @classmethod
     def _convert(cls, *args, **kwargs):
-        return {cls._key(k): v for k, v in dict(*args, **kwargs).items() if isinstance(k, str)}
+        if len(args) == 1 and not kwargs and isinstance(args[0], dict):
+            src = args[0]
+        else:
+            src = dict(*args, **kwargs)
+        return {_normalize_header_key(k): v for k, v in src.items() if isinstance(k, str)}
 
     def update(self, *args, **kwargs) -> None:
         super().update(self._convert(*args, **kwargs))
 
     def encode(self) -> bytes:
-        return ujson.dumps(self, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+        if not self:
+            return b'{}'
+        return _dumps(self)
 
     @classmethod
     def decode(cls, headers: Bytes) -> 'Headers':
+        if not headers or headers == b'{}':
+            return cls()
         try:
-            headers = ujson.loads(headers)
+            headers = _loads(headers)
         except ValueError:  # + UnicodeDecodeError
             headers = None
         return cls(headers or {})
 
 
+if orjson is not None:
+    def _dumps(data: Json) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+    _loads = orjson.loads
+else:
+    def _dumps(data: Json) -> bytes:
+        return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+    _loads = ujson.loads
+
+
 T_Headers: TypeAlias = Headers | dict[str]
@@ -1,11 +1,13 @@
 import asyncio
 import importlib
 import math
+import os
 import re
 import tempfile
 from logging import getLogger
 from pathlib import Path
 from time import time
+from typing import BinaryIO
 
 import ujson
 
@@ -16,7 +18,10 @@ __all__ = [
     'as_uint',
     'Delay',
     'require',
+    'install_uvloop',
     'tmp_file',
+    'copy_bytes',
+    'advise_sequential',
     'int2hex',
     'bytes2hex',
     'format_amount',
@@ -26,6 +31,8 @@ __all__ = [
 
 logging = getLogger('CATS.utils')
 
+IO_CHUNK = 1 << 20
+
 
 def to_uint(number: int, length: int = None) -> bytes:
     if length is None:
@@ -62,12 +69,83 @@ class Delay:
 
 def tmp_file(**kwargs) -> Path:
     """
-    Creates NamedTemporaryFile and returns associated pathlib.Path
-    :param kwargs: NamedTemporaryFile arguments
+    Creates temporary file and returns associated pathlib.Path.
+    File descriptor is closed right away, file itself is kept until unlinked
+    :param kwargs: tempfile.mkstemp arguments (suffix, prefix, dir)
     :return: pathlib.Path(temp_file)
     """
-    kwargs['delete'] = kwargs.get('delete', False)
-    return Path(tempfile.NamedTemporaryFile(**kwargs).name)
+    fd, name = tempfile.mkstemp(**kwargs)
+    os.close(fd)
+    return Path(name)
+
+
+def advise_sequential(fh: BinaryIO) -> None:
+    """
+    Hints kernel that file will be read sequentially, which enables more aggressive readahead.
+    Does nothing on platforms without posix_fadvise()
+    :param fh: opened file
+    """
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(fh.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def copy_bytes(src: BinaryIO, dst: BinaryIO, size: int, offset: int = None) -> None:
+    """
+    Copies exactly `size` bytes from current position of src (or from `offset`) to dst.
+    Regular files are copied in kernel space with os.sendfile(), other streams through a single reusable buffer
+    :param src: readable binary stream
+    :param dst: writable binary stream
+    :param size: amount of bytes to copy
+    :param offset: absolute position in src to copy from. Regular files are then read positionally,
+        without seeking src back and forth
+    :raise ValueError: src ended before `size` bytes were copied
+    """
+    if size <= 0:
+        return
+
+    if hasattr(os, 'sendfile'):
+        try:
+            src_fd, dst_fd = src.fileno(), dst.fileno()
+        except (AttributeError, OSError):
+            pass
+        else:
+            dst.flush()
+            start = pos = src.tell() if offset is None else offset
+            try:
+                while size > 0:
+                    sent = os.sendfile(dst_fd, src_fd, pos, size)
+                    if not sent:
+                        raise ValueError('Unexpected end of stream')
+                    pos += sent
+                    size -= sent
+                return
+            except OSError:
+                # sendfile() may not support file to file copy on this platform, fallback to buffer
+                if pos != start:
+                    raise
+            finally:
+                if offset is None:
+                    src.seek(pos)
+
+    if offset is not None:
+        src.seek(offset)
+    buff = bytearray(min(size, IO_CHUNK))
+    readinto, write = src.readinto, dst.write
+    with memoryview(buff) as view:
+        chunk = len(view)
+        while size > 0:
+            # Only the tail needs a narrower window
+            read = readinto(view if size >= chunk else view[:size])
+            if not read:
+                raise ValueError('Unexpected end of stream')
+            # Raw (unbuffered) streams may write less than requested
+            pending = view[:read]
+            while pending:
+                pending = pending[write(pending):]
+            size -= read
 
 
 def require(dotted_path: str, /, *, strict: bool = True):
@@ -98,6 +176,20 @@ def require(dotted_path: str, /, *, strict: bool = True):
         return None
 
 
+def install_uvloop() -> bool:
+    """
+    Makes asyncio (and so tornado) create uvloop event loops, if `uvloop` is installed.
+    Must be called before the event loop is created, e.g. at the top of entry point
+    :return: whether uvloop is used
+    """
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
 def int2hex(number: int, chars: int = 2) -> str:
     """
     Converts integers to human-readable HEX
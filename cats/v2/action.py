@@ -1,6 +1,5 @@
 import asyncio
 import math
-from io import BytesIO
 from pathlib import Path
 from struct import Struct
 from time import time_ns
@@ -10,7 +9,7 @@ import struct_model
 
 from cats.errors import CatsUsageError, InputCancelled, MalformedDataError, ProtocolError
 from cats.types import Bytes, Headers
-from cats.utils import Delay, as_uint, format_amount, int2hex, tmp_file, to_uint
+from cats.utils import Delay, format_amount, int2hex, tmp_file
 from cats.v2.codecs import Codec, T_FILE
 from cats.v2.compression import Compressor
 
@@ -29,8 +28,11 @@ __all__ = [
 
 MAX_IN_MEMORY = 1 << 24
 MAX_CHUNK_READ = 1 << 20
+MAX_COALESCE = 1 << 16
 PROPOSAL_PLACEHOLDER = bytes(5000)
 
+_U32 = Struct('>I')
+
 ActionLike: TypeAlias = TypeVar('ActionLike', bound='Action')
 
 
@@ -67,6 +69,8 @@ class Input:
 class BaseAction(dict):
     __slots__ = ('data', 'headers', 'message_id', 'conn')
     __registry__ = {}
+    # Same registry, indexed by the single type byte
+    __by_id__: list = [None] * 256
     HEADER_SEPARATOR = b'\x00\x00'
 
     type_id: bytes
@@ -92,6 +96,7 @@ class BaseAction(dict):
             return
         assert cls.type_id not in cls.__registry__, f'ActionType with ID {cls.type_id} already assigned'
         cls.__registry__[cls.type_id] = cls
+        cls.__by_id__[cls.type_id[0]] = cls
 
     @property
     def status(self):
@@ -127,7 +132,9 @@ class BaseAction(dict):
 
     @classmethod
     def get_class_by_type_id(cls, type_id):
-        return cls.__registry__.get(type_id)
+        if len(type_id) != 1:
+            return None
+        return cls.__by_id__[type_id[0]]
 
     async def ask(self, data=None, data_type=None, compression=None, *,
                   headers=None, status=None,
@@ -135,7 +142,7 @@ class BaseAction(dict):
                   timeout=None):
         if not self.conn:
             raise CatsUsageError('Connection is not set')
-        fut = asyncio.Future()
+        fut = asyncio.get_running_loop().create_future()
         timeout = self.conn.conf.input_timeout if timeout is None else timeout
 
         if not bypass_limit:
@@ -168,8 +175,7 @@ class BaseAction(dict):
     async def dump_data(self, size: int) -> None:
         while size > 0:
             size -= len(await self.conn.read(min(size, MAX_CHUNK_READ), partial=True))
-        if fut := self.conn.recv_future:
-            fut.set_result(None)
+        self.conn.release_recv()
 
     async def send(self, conn):
         raise NotImplementedError
@@ -210,19 +216,27 @@ class BasicAction(BaseAction, abstract=True):
         else:
             await self._recv_small_data()
 
-        if fut := self.conn.recv_future:
-            fut.set_result(None)
+        self.conn.release_recv()
 
     async def _recv_small_data(self):
         left = self.data_len
-        buff = bytearray()
-        while left > 0:
-            chunk, left = await self._recv_chunk(left)
-            buff.extend(chunk)
+        if left <= MAX_CHUNK_READ:
+            buff = await self.conn.read(left) if left > 0 else b''
+        else:
+            buff = await self._recv_buffer(left)
 
         buff = await Compressor.decompress(buff, self.headers, compression=self.compression)
         self.data = await Codec.decode(buff, self.data_type, self.headers)
 
+    async def _recv_buffer(self, size):
+        # Read in MAX_CHUNK_READ slices, so the server resets its idle timer while a slow payload arrives
+        buff = bytearray(size)
+        read_into = self.conn.read_into
+        with memoryview(buff) as view:
+            for offset in range(0, size, MAX_CHUNK_READ):
+                await read_into(view[offset:offset + MAX_CHUNK_READ])
+        return buff
+
     async def _recv_large_data(self):
         left = self.data_len
         src, dst = tmp_file(), tmp_file()
@@ -265,25 +279,39 @@ class BasicAction(BaseAction, abstract=True):
             data_len = len(data)
         return data, data_len, data_type, compression
 
-    async def _write_data_to_stream(self, conn, data, data_len, data_type, compression):
+    async def _write_data_to_stream(self, conn, data, data_len, data_type, compression, header=b''):
+        max_chunk_size = min(MAX_IN_MEMORY, conn.download_speed) or MAX_IN_MEMORY
+        delay = Delay(conn.download_speed)
+        if not isinstance(data, Path) and data_len <= min(max_chunk_size, MAX_COALESCE):
+            # Small payload goes out together with the header in a single write
+            await delay(data_len)
+            await conn.write(header + data)
+            return
+
+        # Header is queued together with the first chunk
         if isinstance(data, Path):
-            fh = data.open('rb')
-            left = data.stat().st_size
+            # data_len is already the file size, measured by _encode()
+            with data.open('rb', buffering=0) as fh:
+                left = data_len
+                while left > 0:
+                    size = min(left, max_chunk_size)
+                    chunk = fh.read(size)
+                    left -= size
+                    await delay(size)
+                    await conn.write_many((header, chunk))
+                    header = b''
+            if header:
+                await conn.write(header)
+        elif data_len <= max_chunk_size:
+            await delay(data_len)
+            await conn.write_many((header, data))
         else:
-            fh = BytesIO(data)
-            left = len(data)
-
-        try:
-            max_chunk_size = min(MAX_IN_MEMORY, conn.download_speed) or MAX_IN_MEMORY
-            delay = Delay(conn.download_speed)
-            while left > 0:
-                size = min(left, max_chunk_size)
-                chunk = fh.read(size)
-                left -= size
-                await delay(size)
-                await conn.write(chunk)
-        finally:
-            fh.close()
+            view = memoryview(data)
+            for offset in range(0, data_len, max_chunk_size):
+                chunk = view[offset:offset + max_chunk_size]
+                await delay(len(chunk))
+                await conn.write_many((header, chunk))
+                header = b''
 
     def __repr__(self):
         return f'{type(self).__name__}(data={str(self.data)[:256]}, headers={self.headers}, ' \
@@ -322,7 +350,8 @@ class Action(BasicAction):
         headers = await conn.read_until(cls.HEADER_SEPARATOR, head.data_len)
         head.data_len -= len(headers)
         headers = Headers.decode(headers[:-2])
-        conn.debug(f'[RECV {conn.address}] [{int2hex(head.message_id):<4}] <- HEADERS {headers}')
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] [{int2hex(head.message_id):<4}] <- HEADERS {headers}')
 
         action = cls(**vars(head), headers=headers)
         action.conn = conn
@@ -332,12 +361,13 @@ class Action(BasicAction):
     async def _recv_head(cls, conn):
         buff = await conn.read(cls.Head.struct.size)
         head = cls.Head.unpack(buff)
-        conn.debug(f'[RECV {conn.address}] Request  '
-                   f'H: {int2hex(head.handler_id):<4} '
-                   f'M: {int2hex(head.message_id):<4} '
-                   f'L: {format_amount(head.data_len):<8}'
-                   f'T: {Codec.codecs[head.data_type].type_name:<8} '
-                   f'C: {Compressor.compressors[head.compression].type_name:<8}')
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] Request  '
+                       f'H: {int2hex(head.handler_id):<4} '
+                       f'M: {int2hex(head.message_id):<4} '
+                       f'L: {format_amount(head.data_len):<8}'
+                       f'T: {Codec.get_codec_name(head.data_type):<8} '
+                       f'C: {Compressor.get_compressor_name(head.compression):<8}')
         return head
 
     async def send(self, conn):
@@ -348,25 +378,25 @@ class Action(BasicAction):
             message_headers = self.headers.encode() + self.HEADER_SEPARATOR
 
             _data_len = data_len + len(message_headers)
-            header = self.type_id + self.Head(
+            header = self.type_id + self.Head.struct.pack(
                 self.handler_id,
                 self.message_id,
                 time_ns() // 1000_000,
                 data_type,
                 compression,
                 _data_len
-            ).pack() + message_headers
+            ) + message_headers
 
             async with conn.lock_write():
-                await conn.write(header)
-                conn.debug(f'[SEND {conn.address}] Response '
-                           f'H: {int2hex(self.handler_id):<4} '
-                           f'M: {int2hex(self.message_id):<4} '
-                           f'L: {format_amount(_data_len):<8}'
-                           f'T: {Codec.codecs[data_type].type_name:<8} '
-                           f'C: {Compressor.compressors[compression].type_name:<8} ')
-                conn.debug(f'[SEND {conn.address}] [{int2hex(self.message_id):<4}] -> HEADERS {self.headers}')
-                await self._write_data_to_stream(conn, data, data_len, data_type, compression)
+                if conn.conf.debug:
+                    conn.debug(f'[SEND {conn.address}] Response '
+                               f'H: {int2hex(self.handler_id):<4} '
+                               f'M: {int2hex(self.message_id):<4} '
+                               f'L: {format_amount(_data_len):<8}'
+                               f'T: {Codec.get_codec_name(data_type):<8} '
+                               f'C: {Compressor.get_compressor_name(compression):<8} ')
+                    conn.debug(f'[SEND {conn.address}] [{int2hex(self.message_id):<4}] -> HEADERS {self.headers}')
+                await self._write_data_to_stream(conn, data, data_len, data_type, compression, header)
         finally:
             if isinstance(data, Path):
                 data.unlink(missing_ok=True)
@@ -397,10 +427,12 @@ class StreamAction(Action):
 
     @classmethod
     async def init(cls, conn):
-        head = await cls._recv_head(conn)
-        headers_size = as_uint(await conn.read(4))
-        headers = Headers.decode(await conn.read(headers_size))
-        conn.debug(f'[RECV {conn.address}] [{int2hex(head.message_id):<4}] <- HEADERS {headers}')
+        # Head is always followed by 4 bytes of headers size, fetch both with a single read
+        buff = await conn.read(cls.Head.struct.size + 4)
+        head = cls._unpack_head(conn, buff[:-4])
+        headers = Headers.decode(await conn.read(_U32.unpack_from(buff, cls.Head.struct.size)[0]))
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] [{int2hex(head.message_id):<4}] <- HEADERS {headers}')
 
         action = cls(**vars(head), headers=headers)
         action.conn = conn
@@ -408,13 +440,17 @@ class StreamAction(Action):
 
     @classmethod
     async def _recv_head(cls, conn):
-        buff = await conn.read(cls.Head.struct.size)
+        return cls._unpack_head(conn, await conn.read(cls.Head.struct.size))
+
+    @classmethod
+    def _unpack_head(cls, conn, buff: bytes):
         head = cls.Head.unpack(buff)
-        conn.debug(f'[RECV {conn.address}] Stream   '
-                   f'H: {int2hex(head.handler_id):<4} '
-                   f'M: {int2hex(head.message_id):<4} '
-                   f'T: {Codec.codecs[head.data_type].type_name:<8} '
-                   f'C: {Compressor.compressors[head.compression].type_name:<8} ')
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] Stream   '
+                       f'H: {int2hex(head.handler_id):<4} '
+                       f'M: {int2hex(head.message_id):<4} '
+                       f'T: {Codec.get_codec_name(head.data_type):<8} '
+                       f'C: {Compressor.get_compressor_name(head.compression):<8} ')
         return head
 
     async def recv_data(self):
@@ -422,7 +458,7 @@ class StreamAction(Action):
         buff = tmp_file()
         try:
             with buff.open('wb') as fh:
-                while chunk_size := as_uint(await self.conn.read(4)):
+                while chunk_size := _U32.unpack(await self.conn.read(4))[0]:
                     if chunk_size > MAX_IN_MEMORY:
                         data_len += await self._recv_large_chunk(fh, chunk_size)
                     else:
@@ -439,8 +475,7 @@ class StreamAction(Action):
             self.data = await Codec.decode(decode, self.data_type, self.headers)
             self.data_len = data_len
         finally:
-            if fut := self.conn.recv_future:
-                fut.set_result(None)
+            self.conn.release_recv()
             buff.unlink(missing_ok=True)
 
     async def _recv_large_chunk(self, fh, chunk_size):
@@ -463,12 +498,7 @@ class StreamAction(Action):
             dst.unlink(missing_ok=True)
 
     async def _recv_small_chunk(self, fh, chunk_size):
-        left = chunk_size
-        part = bytearray()
-        while left > 0:
-            chunk = await self.conn.read(min(left, MAX_CHUNK_READ), partial=True)
-            left -= len(chunk)
-            part += chunk
+        part = await self._recv_buffer(chunk_size)
         part = await Compressor.decompress(part, self.headers, compression=self.compression)
         fh.write(part)
         return len(part)
@@ -489,25 +519,25 @@ class StreamAction(Action):
         self.conn = conn
         data, compression = await self._encode_gen(conn)
 
-        header = self.type_id + self.Head(
+        header = self.type_id + self.Head.struct.pack(
             self.handler_id,
             self.message_id,
             time_ns() // 1000_000,
             self.data_type,
             compression
-        ).pack()
+        )
         message_headers = self.headers.encode()
+        header += _U32.pack(len(message_headers)) + message_headers
 
         async with conn.lock_write():
             await conn.write(header)
-            await conn.write(to_uint(len(message_headers), 4))
-            await conn.write(message_headers)
-            conn.debug(f'[SEND {conn.address}] Stream   '
-                       f'H: {int2hex(self.handler_id):<4} '
-                       f'M: {int2hex(self.message_id):<4} '
-                       f'T: {Codec.codecs[self.data_type].type_name:<8} '
-                       f'C: {Compressor.compressors[compression].type_name:<8} ')
-            conn.debug(f'[SEND {conn.address}] [{int2hex(self.message_id):<4}] -> HEADERS {self.headers}')
+            if conn.conf.debug:
+                conn.debug(f'[SEND {conn.address}] Stream   '
+                           f'H: {int2hex(self.handler_id):<4} '
+                           f'M: {int2hex(self.message_id):<4} '
+                           f'T: {Codec.get_codec_name(self.data_type):<8} '
+                           f'C: {Compressor.get_compressor_name(compression):<8} ')
+                conn.debug(f'[SEND {conn.address}] [{int2hex(self.message_id):<4}] -> HEADERS {self.headers}')
             await self._write_data_to_stream(conn, data, compression=compression)
 
     async def _write_data_to_stream(self, conn, data, *_, compression):
@@ -530,8 +560,7 @@ class StreamAction(Action):
                 raise MalformedDataError('Provided data chunk exceeded max chunk size', data=data, headers=self.headers)
 
             await delay(chunk_size + 4)
-            await conn.write(to_uint(chunk_size, 4))
-            await conn.write(chunk)
+            await conn.write_many((_U32.pack(chunk_size), chunk))
         await conn.write(b'\x00\x00\x00\x00')
 
     @staticmethod
@@ -565,11 +594,12 @@ class InputAction(Action):
     async def _recv_head(cls, conn):
         buff = await conn.read(cls.Head.struct.size)
         head = cls.Head.unpack(buff)
-        conn.debug(f'[RECV {conn.address}] Answer   '
-                   f'M: {int2hex(head.message_id):<4} '
-                   f'L: {format_amount(head.data_len):<8}'
-                   f'T: {Codec.codecs[head.data_type].type_name:<8} '
-                   f'C: {Compressor.compressors[head.compression].type_name:<8} ')
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] Answer   '
+                       f'M: {int2hex(head.message_id):<4} '
+                       f'L: {format_amount(head.data_len):<8}'
+                       f'T: {Codec.get_codec_name(head.data_type):<8} '
+                       f'C: {Compressor.get_compressor_name(head.compression):<8} ')
         return head
 
     async def send(self, conn):
@@ -578,22 +608,22 @@ class InputAction(Action):
         try:
             message_headers = self.headers.encode() + self.HEADER_SEPARATOR
             _data_len = data_len + len(message_headers)
-            header = self.type_id + self.Head(
+            header = self.type_id + self.Head.struct.pack(
                 self.message_id,
                 data_type,
                 compression,
                 _data_len
-            ).pack() + message_headers
+            ) + message_headers
 
             async with conn.lock_write():
-                await conn.write(header)
-                conn.debug(f'[SEND {conn.address}] Input    '
-                           f'M: {int2hex(self.message_id):<4} '
-                           f'L: {format_amount(_data_len):<8}'
-                           f'T: {Codec.codecs[data_type].type_name:<8} '
-                           f'C: {Compressor.compressors[compression].type_name:<8} ')
-                conn.debug(f'[SEND {conn.address}] [{int2hex(self.message_id):<4}] -> HEADERS {self.headers}')
-                await self._write_data_to_stream(conn, data, data_len, data_type, compression)
+                if conn.conf.debug:
+                    conn.debug(f'[SEND {conn.address}] Input    '
+                               f'M: {int2hex(self.message_id):<4} '
+                               f'L: {format_amount(_data_len):<8}'
+                               f'T: {Codec.get_codec_name(data_type):<8} '
+                               f'C: {Compressor.get_compressor_name(compression):<8} ')
+                    conn.debug(f'[SEND {conn.address}] [{int2hex(self.message_id):<4}] -> HEADERS {self.headers}')
+                await self._write_data_to_stream(conn, data, data_len, data_type, compression, header)
         finally:
             if isinstance(data, Path):
                 data.unlink(missing_ok=True)
@@ -624,18 +654,18 @@ class DownloadSpeedAction(BaseAction):
 
     @classmethod
     async def init(cls, conn):
-        buff = await conn.read(cls.Head.struct.size)
-        head = cls.Head.unpack(buff)
-        conn.debug(f'[RECV {conn.address}] SET Download speed: {format_amount(head.speed)}')
-        action = cls(**vars(head))
+        speed, = cls.Head.struct.unpack(await conn.read(cls.Head.struct.size))
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] SET Download speed: {format_amount(speed)}')
+        action = cls(speed)
         action.conn = conn
         return action
 
     async def send(self, conn):
         async with conn.lock_write():
-            speed: int = self.data
-            await conn.write(self.type_id + to_uint(speed, 4))
-            conn.debug(f'[SEND {conn.address}] SET Download speed: {format_amount(speed)}')
+            await conn.write(self.type_id + self.Head.struct.pack(self.speed))
+            if conn.conf.debug:
+                conn.debug(f'[SEND {conn.address}] SET Download speed: {format_amount(self.speed)}')
 
     def __repr__(self):
         return f'{type(self).__name__}(speed={self.speed})'
@@ -649,18 +679,19 @@ class CancelInputAction(BaseAction):
 
     @classmethod
     async def init(cls, conn):
-        buff = await conn.read(cls.Head.struct.size)
-        head = cls.Head.unpack(buff)
-        conn.debug(f'[RECV {conn.address}] CANCEL Input M: {int2hex(head.message_id):<4}')
-        action = cls(**vars(head))
+        message_id, = cls.Head.struct.unpack(await conn.read(cls.Head.struct.size))
+        if conn.conf.debug:
+            conn.debug(f'[RECV {conn.address}] CANCEL Input M: {int2hex(message_id):<4}')
+        action = cls(message_id=message_id)
         action.conn = conn
         return action
 
     async def send(self, conn):
         async with conn.lock_write():
             message_id: int = self.data
-            await conn.write(self.type_id + to_uint(message_id, 2))
-            conn.debug(f'[SEND {conn.address}] CANCEL Input M: {message_id}')
+            await conn.write(self.type_id + self.Head.struct.pack(message_id))
+            if conn.conf.debug:
+                conn.debug(f'[SEND {conn.address}] CANCEL Input M: {message_id}')
 
 
 class PingAction(BaseAction):
@@ -669,6 +700,9 @@ class PingAction(BaseAction):
     class Head(struct_model.StructModel):
         send_time: struct_model.uInt8
 
+    # Whole outgoing frame: type_id + send_time
+    FRAME = Struct('>1sQ')
+
     def __init__(self, send_time=None):
         super().__init__()
         self.recv_time = time_ns() // 1000_000
@@ -676,19 +710,20 @@ class PingAction(BaseAction):
 
     @classmethod
     async def init(cls, conn):
-        buff = await conn.read(cls.Head.struct.size)
-        head = cls.Head.unpack(buff)
-        conn.debug(f'[PING {conn.address}] {head.send_time}')
+        send_time, = cls.Head.struct.unpack(await conn.read(cls.Head.struct.size))
+        if conn.conf.debug:
+            conn.debug(f'[PING {conn.address}] {send_time}')
 
-        action = cls(**vars(head))
+        action = cls(send_time)
         action.conn = conn
         return action
 
     async def send(self, conn):
         async with conn.lock_write():
             now = time_ns() // 1000_000
-            await conn.write(self.type_id + to_uint(now, 8))
-            conn.debug(f'[SEND {conn.address}] PONG {now}')
+            await conn.write(self.FRAME.pack(self.type_id, now))
+            if conn.conf.debug:
+                conn.debug(f'[SEND {conn.address}] PONG {now}')
 
     def __repr__(self):
         return f'{type(self).__name__}(send_time={self.send_time})'
@@ -26,6 +26,7 @@ logging = getLogger('CATS.conn')
 
 MAX_IN_MEMORY: int
 MAX_CHUNK_READ: int
+MAX_COALESCE: int
 
 ActionLike: TypeAlias = TypeVar('ActionLike', bound='Action')
 
@@ -55,6 +56,7 @@ class Input:
 class BaseAction(dict):
     __slots__ = ('data', 'headers', 'message_id', 'conn')
     __registry__: dict[bytes, Type['BaseAction']] = {}
+    __by_id__: list[Type['BaseAction'] | None]
     HEADER_SEPARATOR = b'\x00\x00'
 
     type_id: bytes
@@ -112,12 +114,14 @@ class BasicAction(BaseAction):
 
     async def _recv_large_data(self) -> None: ...
 
+    async def _recv_buffer(self, size: int) -> bytearray: ...
+
     async def _recv_chunk(self, left: int) -> (bytes, int): ...
 
     async def _encode(self) -> tuple[Path | bytes, int, int, int]: ...
 
     async def _write_data_to_stream(self, conn: Connection, data: Path | bytes,
-                                    data_len: int, data_type: int, compression: int) -> None: ...
+                                    data_len: int, data_type: int, compression: int, header: bytes = b'') -> None: ...
 
     def __repr__(self) -> str: ...
 
@@ -173,6 +177,9 @@ class StreamAction(Action):
     @classmethod
     async def _recv_head(cls, conn: Connection) -> 'StreamAction.Head': ...
 
+    @classmethod
+    def _unpack_head(cls, conn: Connection, buff: bytes) -> 'StreamAction.Head': ...
+
     async def recv_data(self) -> None: ...
 
     async def _recv_large_chunk(self, fh, chunk_size) -> int: ...
@@ -39,19 +39,22 @@ class Auth:
             assert isinstance(method, type) and issubclass(method, AuthMethod)
             params = frozenset(inspect.signature(method.sign_in).parameters.keys())
             self.methods[frozenset(params)].append(method)
+        self._sign_in: dict[frozenset, tuple] = {
+            params: tuple(method.sign_in for method in methods)
+            for params, methods in self.methods.items()
+        }
 
     async def sign_in(self, **kwargs) -> tuple[IdentityObject, Any, int | float | None]:
         prev_err = None
-        for method in self.methods.get(frozenset(kwargs.keys()), []):
+        for sign_in in self._sign_in.get(frozenset(kwargs), ()):
             try:
-                return await method.sign_in(**kwargs)
+                return await sign_in(**kwargs)
             except (KeyboardInterrupt, asyncio.CancelledError, asyncio.TimeoutError):
                 raise
             except Exception as exc:
-                try:
-                    raise exc from prev_err
-                except BaseException as err:
-                    prev_err = err
+                exc.__cause__ = prev_err
+                exc.__suppress_context__ = True
+                prev_err = exc
         raise AuthError('Unable to authenticate') from prev_err
 
     async def sign_in_silent(self, **kwargs) -> tuple[IdentityObject | None, Any | None, int | float | None]:
@@ -1,6 +1,6 @@
 from tornado.iostream import StreamClosedError
 
-from cats import str2bytes
+from cats import install_uvloop, str2bytes
 from cats.errors import HandshakeError, ProtocolError
 from cats.v2.action import PingAction
 
@@ -87,4 +87,5 @@ if __name__ == '__main__':
         default=False, help='Enable debug. Default: False',
     )
     args = vars(parser.parse_args())
+    install_uvloop()
     asyncio.run(main(**args))
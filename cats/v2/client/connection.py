@@ -2,7 +2,6 @@ import asyncio
 import inspect
 from collections import defaultdict
 from logging import getLogger
-from random import randint
 from time import time, time_ns
 from typing import Awaitable, Callable
 
@@ -12,7 +11,8 @@ from tornado.tcpclient import TCPClient
 from cats.errors import ProtocolError
 from cats.types import BytesAnyGen
 from cats.utils import as_uint, to_uint
-from cats.v2.action import Action, ActionLike, BaseAction, PingAction, StreamAction
+from cats.v2.action import Action, ActionLike, BaseAction, DownloadSpeedAction, PingAction, StreamAction
+from cats.v2.compression import Compressor
 from cats.v2.config import Config
 from cats.v2.connection import Connection as BaseConnection
 from cats.v2.statement import ClientStatement, ServerStatement
@@ -29,13 +29,14 @@ class Connection(BaseConnection):
         'subscriptions',
         'address',
         '_sub_id',
+        '_subscribers',
         '_stream',
         '_listener',
-        '_sender',
         '_pinger',
         '_recv_pool',
     )
     PROTOCOL_VERSION: int = 2
+    SHARED_COMPRESSORS: tuple[str, ...] = ('gzip', 'zlib')
     logging = getLogger('CATS.Client')
 
     def __init__(self, conf: Config, api_version: int):
@@ -47,8 +48,9 @@ class Connection(BaseConnection):
             dict
         )
         self._sub_id: int = 0
+        # handler_id -> snapshot of (subscribed callback, whether it is a coroutine function)
+        self._subscribers: dict[int, tuple[tuple[Callable, bool], ...]] = {}
         self._listener: asyncio.Task | None = None
-        self._sender: asyncio.Task | None = None
         self._pinger: asyncio.Task | None = None
         self._recv_pool: dict[int, asyncio.Future] = {}
         self._stream: IOStream | None = None
@@ -64,16 +66,25 @@ class Connection(BaseConnection):
         self.debug(f'New connection established: {self.address}')
 
     async def start(self) -> None:
-        self._sender = self._loop.create_task(self.send_loop())
         self._pinger = self._loop.create_task(self.ping())
-
-        self._sender.add_done_callback(self.on_tick_done)
         self._pinger.add_done_callback(self.on_tick_done)
 
         await self.recv_loop()
 
     async def init(self):
-        await self.write(to_uint(self.PROTOCOL_VERSION, 4))
+        # Advertise everything we can decode, but only send what every server understands:
+        # ServerStatement does not report server-side compressors, so zstd is never assumed
+        compressors = [name for name in Compressor.codes if name != 'dummy']
+        client_stmt = ClientStatement(
+            api=self.api_version,
+            client_time=time_ns() // 1000_000,
+            scheme_format='JSON',
+            compressors=compressors,
+            default_compression='zstd' if 'zstd' in compressors else 'zlib',
+        )
+        self.set_compressors(self.SHARED_COMPRESSORS, 'zlib')
+        # Server reads statement only after accepting protocol version, so both are sent without waiting for reply
+        await self.write(to_uint(self.PROTOCOL_VERSION, 4) + client_stmt.pack(), no_delay=True)
         result = await self.read(4)
         if result != bytes(4):
             raise ProtocolError(
@@ -82,18 +93,7 @@ class Connection(BaseConnection):
                 conn=self
             )
 
-        client_stmt = ClientStatement(
-            api=self.api_version,
-            client_time=time_ns() // 1000_000,
-            scheme_format='JSON',
-            compressors=['gzip', 'zlib'],
-            default_compression='zlib',
-        )
-        self.set_compressors(['gzip', 'zlib'], 'zlib')
-        await self.write(client_stmt.pack())
-        stmt: ServerStatement = ServerStatement.unpack(
-            await self.read(as_uint(await self.read(4)))
-        )
+        stmt: ServerStatement = ServerStatement.unpack(await self.read_framed())
         self.time_delta = (stmt.server_time / 1000) - time()
 
         if self.conf.handshake is not None:
@@ -101,33 +101,44 @@ class Connection(BaseConnection):
 
         self.debug(f'{self} initialized')
 
+    ACTION_HANDLERS = {
+        PingAction: 'handle_ping_action',
+        Action: 'handle_action',
+    }
+
     async def handle(self, action: BaseAction):
-        if isinstance(action, PingAction):
-            await self.handle_ping_action(action)
-        elif isinstance(action, Action):
-            await action.recv_data()
-            if action.message_id >= 0x8000:
-                await self.handle_broadcast(action)
-            elif action.message_id in self._recv_pool:
-                await self.handle_response(action)
-            else:
-                self.debug(f'Received unexpected action {action = }')
+        if (handler := self.get_action_handler(type(action))) is not None:
+            await getattr(self, handler)(action)
         else:
             self.debug(f'Received unsupported Action: {type(action).__qualname__}')
 
-    async def handle_response(self, action: Action):
-        future = self._recv_pool.pop(action.message_id)
-        future.set_result(action)
+    async def handle_action(self, action: Action):
+        await action.recv_data()
+        if action.message_id >= 0x8000:
+            await self.handle_broadcast(action)
+        elif (future := self._recv_pool.pop(action.message_id, None)) is not None:
+            future.set_result(action)
+        else:
+            self.debug(f'Received unexpected action {action = }')
 
     async def handle_broadcast(self, action: Action):
-        if action.handler_id in self.subscriptions:
-            for fn in self.subscriptions[action.handler_id].values():
-                res = fn(action)
-                if inspect.isawaitable(res):
-                    await res
+        await self.notify_subscribers(action)
+
+    async def notify_subscribers(self, action: Action):
+        if (subscribers := self._subscribers.get(action.handler_id)) is None:
+            handlers = self.subscriptions.get(action.handler_id, {}).values()
+            subscribers = self._subscribers[action.handler_id] = tuple(
+                (fn, inspect.iscoroutinefunction(fn)) for fn in handlers
+            )
+        for fn, is_coro in subscribers:
+            if is_coro:
+                await fn(action)
+            elif hasattr(res := fn(action), '__await__'):
+                await res
 
     async def handle_ping_action(self, action: PingAction):
-        self.debug(f'Pong {action.send_time} [-] {action.recv_time}')
+        if self.conf.debug:
+            self.debug(f'Pong {action.send_time} [-] {action.recv_time}')
         await action.dump_data(0)
 
     def subscribe(
@@ -137,6 +148,7 @@ class Connection(BaseConnection):
     ) -> int:
         self._sub_id += 1
         self.subscriptions[handler_id][self._sub_id] = handler
+        self._subscribers.pop(handler_id, None)
         return self._sub_id
 
     def unsubscribe(
@@ -148,14 +160,24 @@ class Connection(BaseConnection):
             if isinstance(handler, int):
                 self.subscriptions[handler_id].pop(handler, None)
             else:
-                self.subscriptions[handler_id] = {
-                    k: v for k, v in self.subscriptions[handler_id]
-                    if v is not handler
-                }
+                subscriptions = self.subscriptions[handler_id]
+                for sub_id in [k for k, v in subscriptions.items() if v is handler]:
+                    del subscriptions[sub_id]
+            self._subscribers.pop(handler_id, None)
+
+    def invalidate_subscribers(self, handler_id: int | None = None) -> None:
+        """
+        Drops cached snapshot of subscribers, must be called after editing `subscriptions` directly
+        :param handler_id: Handler which subscriptions were edited, all of them if None
+        :return:
+        """
+        if handler_id is None:
+            self._subscribers.clear()
+        else:
+            self._subscribers.pop(handler_id, None)
 
     async def set_download_speed(self, speed=0):
-        await self.write(b'\x05')
-        await self.write(to_uint(speed, 4))
+        await DownloadSpeedAction(speed).send(self)
 
     async def send(
         self,
@@ -192,7 +214,7 @@ class Connection(BaseConnection):
         return await self.recv(action.message_id)
 
     async def recv(self, message_id: int) -> Action | None:
-        future = asyncio.Future()
+        future = self._loop.create_future()
         self._recv_pool[message_id] = future
         return await future
 
@@ -209,13 +231,14 @@ class Connection(BaseConnection):
         return f'CATS.Connection: {self.host}:{self.port} api@{self.api_version}'
 
     def get_free_message_id(self) -> int:
+        message_id = self._next_message_id
         while True:
-            message_id = randint(0x0000, 0x7FFF)
-            if message_id not in self._message_pool:
+            message_id = (message_id + 1) & 0x7FFF
+            if message_id not in self._message_pool and message_id not in self._recv_pool:
+                self._next_message_id = message_id
                 return message_id
 
     def _close_tasks(self):
         yield from super()._close_tasks()
         yield from self._recv_pool.values()
         yield self._pinger
-        yield self._sender
@@ -1,15 +1,23 @@
+import asyncio
+import os
+import weakref
+from copy import deepcopy
 from dataclasses import dataclass
 from io import BytesIO
-from os.path import getsize
 from pathlib import Path
 from typing import IO, TypeAlias
 
 import ujson
 
 from cats.errors import *
-from cats.plugins import BaseModel, BaseSerializer, Form, scheme_json
-from cats.types import Byte, Json, List, T_Headers
-from cats.utils import tmp_file
+from cats.plugins import Form, SchemeTypes, scheme_json
+from cats.types import Byte, Bytes, Json, List, T_Headers
+from cats.utils import advise_sequential, copy_bytes, tmp_file
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 __all__ = [
     'FileInfo',
@@ -41,10 +49,83 @@ class Files(dict):
                 raise ValidationError('File key must be string', data=self)
             elif not isinstance(v, FileInfo):
                 raise ValidationError('File value must be FileInfo', data=self)
+        self._track()
+
+    @classmethod
+    def _from_trusted(cls, items: dict[str, FileInfo]) -> 'Files':
+        """
+        Build Files from already validated items, skipping per-item checks
+        """
+        self = dict.__new__(cls)
+        dict.update(self, items)
+        self._track()
+        return self
+
+    def _track(self):
+        """
+        Unlink files once this object is collected. Unlike __del__, finalizer also runs at interpreter shutdown,
+        when module globals may already be gone. Finalizer holds a key -> path mirror of this mapping, so it sees
+        files added or removed after construction
+        """
+        self._paths = {k: v.path.as_posix() for k, v in self.items()}
+        weakref.finalize(self, _unlink_all, self._paths)
+
+    # Pickle and copy rebuild through _from_trusted: every copy gets its own mirror and finalizer,
+    # items are never replayed through __setitem__ before the mirror exists
+
+    def __reduce__(self):
+        return type(self)._from_trusted, (dict(self),)
+
+    def __copy__(self) -> 'Files':
+        return type(self)._from_trusted(self)
+
+    def __deepcopy__(self, memo) -> 'Files':
+        memo[id(self)] = res = type(self)._from_trusted({k: deepcopy(v, memo) for k, v in self.items()})
+        return res
 
-    def __del__(self):
-        for v in self.values():
-            v.path.unlink(missing_ok=True)
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._mirror(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._paths.pop(key, None)
+
+    def _mirror(self, key, value):
+        if isinstance(value, FileInfo):
+            self._paths[key] = value.path.as_posix()
+        else:
+            self._paths.pop(key, None)
+
+    def update(self, *args, **kwargs) -> None:
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        self._paths.pop(key, None)
+        return super().pop(key, *args)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._paths.pop(key, None)
+        return key, value
+
+    def clear(self) -> None:
+        super().clear()
+        self._paths.clear()
+
+
+def _unlink_all(paths: dict[str, str]):
+    for path in paths.values():
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
 
 
 class BaseCodec:
@@ -77,13 +158,37 @@ class ByteCodec(BaseCodec):
         if data is not None and not isinstance(data, Byte):
             raise InvalidCodecError(f'{cls} does not support {type(data)}', data=data, headers=headers)
 
-        return (bytes(data) if data else bytes())[offset:]
+        if not data:
+            return b''
+        if offset:
+            return bytes(memoryview(data)[offset:])
+        return data if type(data) is bytes else bytes(data)
 
     @classmethod
     async def decode(cls, data: bytes, headers: T_Headers) -> bytes:
         return bytes(data) if data else bytes()
 
 
+if orjson is not None:
+    def _dumps(data: Json) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+    def _loads(data: Bytes) -> Json:
+        return orjson.loads(data)
+else:
+    def _dumps(data: Json) -> bytes:
+        return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+    def _loads(data: Bytes) -> Json:
+        return ujson.loads(data.decode('utf-8'))
+
+
+# isinstance() target, built once instead of on every encode
+_JSON_TYPES = (dict, list, str, int, float, bool, type(None))
+
+
 class JsonCodec(BaseCodec):
     type_id = 0x01
     type_name = 'json'
@@ -92,11 +197,11 @@ class JsonCodec(BaseCodec):
     async def encode(cls, data: Json | Form | list[Form], headers: T_Headers, offset: int = 0) -> bytes:
         try:
             if data:
-                if isinstance(data, (BaseModel, BaseSerializer)):
+                if isinstance(data, SchemeTypes):
                     return scheme_json(type(data), data, many=False, plain=True)
                 elif isinstance(data, List):
                     data = list(data)
-                    if isinstance(data[0], (BaseModel, BaseSerializer)):
+                    if isinstance(data[0], SchemeTypes):
                         return scheme_json(type(data[0]), data, many=True, plain=True)
             return await cls._encode(data, offset=offset)
         except TypeError as err:
@@ -104,10 +209,11 @@ class JsonCodec(BaseCodec):
 
     @classmethod
     async def _encode(cls, data: Json, offset: int = 0) -> bytes:
-        if not isinstance(data, (str, int, float, dict, list, bool, type(None))):
+        if not isinstance(data, _JSON_TYPES):
             raise TypeError
 
-        return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')[offset:]
+        buff = _dumps(data)
+        return buff[offset:] if offset else buff
 
     @classmethod
     async def decode(cls, data: bytes, headers) -> Json:
@@ -115,7 +221,7 @@ class JsonCodec(BaseCodec):
             return {}
 
         try:
-            return ujson.loads(data.decode('utf-8'))
+            return _loads(data)
         except ValueError as err:
             raise CodecError('Failed to parse JSON from data', data=data, headers=headers) from err
 
@@ -133,7 +239,7 @@ class FileCodec(BaseCodec):
         if isinstance(path, FileInfo):
             return path
         elif isinstance(path, Path):
-            return FileInfo(path.name, path, getsize(path.as_posix()), None)
+            return FileInfo(path.name, path, path.stat().st_size, None)
         raise TypeError
 
     @classmethod
@@ -167,21 +273,27 @@ class FileCodec(BaseCodec):
         try:
             buff = tuple(cls.normalize_input(data).items())
             header = []
+            parts = []
+            position = 0
+            for key, info in buff:
+                left = info.size - offset
+                offset = max(0, offset - left)
+                if left < 0:
+                    continue
+                header.append({"key": key, "name": info.name, "size": left, "type": info.mime})
+                parts.append((info.path, info.size - left, position, left))
+                position += left
             with tmp.open('wb') as fh:
-                for key, info in buff:
-                    left = info.size - offset
-                    offset = max(0, offset - left)
-                    if left < 0:
-                        continue
-                    header.append({"key": key, "name": info.name, "size": left, "type": info.mime})
-                    with info.path.open('rb') as f_fh:
-                        f_fh.seek(info.size - left)
-                        while left > 0:
-                            buff = f_fh.read(1 << 24)
-                            if not len(buff):
-                                raise ValueError
-                            fh.write(buff)
-                            left -= len(buff)
+                try:
+                    # Reserve all extents up front, so concurrent writers don't fragment the file
+                    os.posix_fallocate(fh.fileno(), 0, position)
+                except (AttributeError, OSError, ValueError):
+                    # Not supported by platform/filesystem, or nothing to allocate
+                    fh.truncate(position)
+            # Every file lands at its own precomputed position, so they are copied concurrently.
+            # Concurrency is bounded by the default executor, largest files are scheduled first to avoid stragglers
+            parts.sort(key=lambda part: part[-1], reverse=True)
+            await asyncio.gather(*(asyncio.to_thread(cls._copy_part, src, tmp, *part) for src, *part in parts))
             headers['Files'] = header
             return tmp
 
@@ -189,10 +301,21 @@ class FileCodec(BaseCodec):
             tmp.unlink(missing_ok=True)
             raise InvalidCodecError(f'{cls} does not support {type(data)}', data=data, headers=headers) from err
 
+    @staticmethod
+    def _copy_part(src: Path, dst: Path, src_offset: int, dst_offset: int, size: int) -> None:
+        with src.open('rb', buffering=0) as rc, dst.open('r+b', buffering=0) as wc:
+            advise_sequential(rc)
+            wc.seek(dst_offset)
+            copy_bytes(rc, wc, size, offset=src_offset)
+
     @classmethod
     async def decode(cls, data: Path | bytes | bytearray, headers) -> Files:
-        result = Files()
-        buff = data.open('rb') if isinstance(data, Path) else BytesIO(data)
+        result: dict[str, FileInfo] = {}
+        if isinstance(data, Path):
+            buff = data.open('rb')
+            advise_sequential(buff)
+        else:
+            buff = BytesIO(data)
 
         try:
             if 'Files' not in headers:
@@ -217,7 +340,7 @@ class FileCodec(BaseCodec):
                     mime=node.get('type'),
                 )
 
-            return result
+            return Files._from_trusted(result)
         except (KeyError, ValueError, TypeError) as err:
             for v in result.values():
                 v.path.unlink(missing_ok=True)
@@ -228,14 +351,12 @@ class FileCodec(BaseCodec):
     @classmethod
     async def _unpack_file(cls, fh: IO, node) -> Path:
         tmp = tmp_file()
-        left = node['size']
-        with tmp.open('wb') as node_fh:
-            while left > 0:
-                buff = fh.read(min(left, 1 << 24))
-                if not len(buff):
-                    raise ValueError('Failed to unpack file: payload size exceeded')
-                node_fh.write(buff)
-                left -= len(buff)
+        try:
+            with tmp.open('wb') as node_fh:
+                copy_bytes(fh, node_fh, node['size'])
+        except ValueError as err:
+            tmp.unlink(missing_ok=True)
+            raise ValueError('Failed to unpack file: payload size exceeded') from err
         return tmp
 
 
@@ -250,12 +371,45 @@ class Codec:
         T_JSON: JsonCodec,
         T_FILE: FileCodec,
     }
+    # Same registry, indexed by the single type byte, kept in sync by `register`
+    by_id: list[type[BaseCodec] | None] = list(map(codecs.get, range(256)))
+    # Types that always end up in the same codec. Containers (dict, list, ...) may hold either JSON or files,
+    # so they are still resolved by trying each codec in order
+    by_type: dict[type, type[BaseCodec]] = {
+        type(None): ByteCodec,
+        bytes: ByteCodec,
+        bytearray: ByteCodec,
+        memoryview: ByteCodec,
+        str: JsonCodec,
+        int: JsonCodec,
+        float: JsonCodec,
+        bool: JsonCodec,
+        type(Path()): FileCodec,
+        FileInfo: FileCodec,
+    }
+
+    @classmethod
+    def register(cls, codec: type[BaseCodec]) -> None:
+        """
+        Adds codec to registry, replacing one with the same type_id
+        :param codec:
+        :return:
+        """
+        assert 0 <= codec.type_id < 256, f'Codec ID {codec.type_id} does not fit in a byte'
+        cls.codecs[codec.type_id] = codec
+        cls.by_id[codec.type_id] = codec
 
     @classmethod
     async def encode(cls, buff: Byte | Json | FILE_TYPES, headers: T_Headers, offset: int = 0) -> (bytes, int):
         """
         Takes any supported data type and returns tuple (encoded: bytes, type_id: int)
         """
+        if (codec := cls.by_type.get(type(buff))) is not None:
+            try:
+                return await codec.encode(buff, headers, offset), codec.type_id
+            except InvalidCodecError:
+                pass
+
         for type_id, codec in cls.codecs.items():
             try:
                 encoded = await codec.encode(buff, headers, offset)
@@ -275,7 +429,8 @@ class Codec:
 
         return await cls.codecs[data_type].decode(buff, headers)
 
-    def get_codec_name(self, type_id: int, default: str = 'unknown') -> str:
+    @classmethod
+    def get_codec_name(cls, type_id: int, default: str = 'unknown') -> str:
         """
         Returns Type Name by its id (w/ fallback to default)
         :param type_id:
@@ -283,6 +438,6 @@ class Codec:
         :return:
         """
         try:
-            return self.codecs[type_id].type_name
-        except KeyError:
+            return cls.by_id[type_id].type_name
+        except (IndexError, AttributeError):
             return default
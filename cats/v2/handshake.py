@@ -1,5 +1,6 @@
 import asyncio
 import hashlib
+from hmac import compare_digest
 from time import time
 
 from cats.errors import HandshakeError
@@ -34,41 +35,72 @@ class Handshake:
 
 
 class SHA256TimeHandshake(Handshake):
-    __slots__ = ('secret_key', 'valid_window', 'timeout')
+    __slots__ = ('secret_key', 'valid_window', 'timeout', '_cache', '_seed', '_warming')
+    CACHE_SIZE = 4
+    WARMUP_LEAD = 1.0
 
     def __init__(self, secret_key: bytes, valid_window: int = None, timeout: int | float = 5.0):
         assert isinstance(secret_key, bytes) and secret_key
         self.secret_key = secret_key
         self.valid_window = valid_window or 1
         self.timeout = timeout
+        self._cache: dict[int, tuple[bytes, ...]] = {}
+        self._seed = hashlib.sha256(secret_key)
+        self._warming: int | None = None
         assert self.valid_window >= 1
 
-    def get_hashes(self, timestamp: float) -> list[bytes]:
+    def get_hashes(self, timestamp: float) -> tuple[bytes, ...]:
         ts = round(timestamp / 10) * 10
+        try:
+            return self._cache[ts]
+        except KeyError:
+            pass
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            del self._cache[next(iter(self._cache))]
+        self._cache[ts] = hashes = self._hashes_for_bucket(ts)
+        return hashes
 
-        return [
-            hashlib.sha256(self.secret_key + str(ts + i * 10).encode('utf-8')).digest()
-            for i in range(-self.valid_window, self.valid_window + 1)
-        ]
+    def _hashes_for_bucket(self, ts: int) -> tuple[bytes, ...]:
+        copy = self._seed.copy
+        hashes = []
+        for i in range(-self.valid_window, self.valid_window + 1):
+            h = copy()
+            h.update(b'%d' % (ts + i * 10))
+            hashes.append(h.digest())
+        return tuple(hashes)
+
+    def _schedule_warmup(self, now: float) -> None:
+        # Compute the next bucket shortly before it becomes current, so no validate() pays for it
+        ts = round(now / 10) * 10 + 10
+        if ts == self._warming or ts in self._cache:
+            return
+        self._warming = ts
+        asyncio.get_running_loop().call_later(max(ts - 5 - self.WARMUP_LEAD - now, 0), self.get_hashes, ts)
 
     async def validate(self, conn) -> None:
         handshake: bytes = await asyncio.wait_for(conn.read(32), self.timeout)
         conn.debug(f'[RECV {conn.address}] Handshake: {bytes2hex(handshake)}')
         try:
-            if handshake not in self.get_hashes(time()):
-                await conn.write(b'\x00')
+            now = time()
+            matched = False
+            for candidate in self.get_hashes(now):
+                matched |= compare_digest(candidate, handshake)
+            self._schedule_warmup(now)
+            if not matched:
+                await conn.write(b'\x00', no_delay=True)
                 conn.debug(f'[SEND {conn.address} Handshake failed')
                 raise HandshakeError('Invalid handshake', conn=conn, handshake=handshake)
         except UnicodeDecodeError as err:
-            await conn.write(b'\x00')
+            await conn.write(b'\x00', no_delay=True)
             raise HandshakeError('Malformed handshake', conn=conn, handshake=handshake) from err
         else:
-            await conn.write(b'\x01')
+            await conn.write(b'\x01', no_delay=True)
             conn.debug(f'[SEND {conn.address}] Handshake passed')
 
     async def send(self, conn) -> None:
         handshake = self.get_hashes(conn.time_delta + time())[1]
-        await conn.write(handshake)
+        await conn.write(handshake, no_delay=True)
         result = await conn.read(1)
         if result == b'\x01':
             conn.debug(f'[SEND {conn.address}] Handshake passed')
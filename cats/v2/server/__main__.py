@@ -1,4 +1,4 @@
-from cats.utils import str2bytes
+from cats.utils import install_uvloop, str2bytes
 
 
 def main(host: str, port: int,
@@ -65,6 +65,7 @@ if __name__ == '__main__':
     parser.add_argument('--debug', '-D', dest='debug', action='store_true',
                         default=False, help='Enable debug. Default: False')
     args = vars(parser.parse_args())
+    install_uvloop()
     try:
         main(**args)
     except KeyboardInterrupt:
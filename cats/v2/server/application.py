@@ -15,7 +15,7 @@ __all__ = [
 
 
 class Application:
-    __slots__ = ('config', 'auth', 'ConnectionClass', '_handlers', '_channels', '_runner')
+    __slots__ = ('config', 'auth', 'ConnectionClass', '_handlers', '_get_handler', '_channels', '_runner')
 
     def __init__(self, apis: list[Api], middleware: list[Middleware] = None, *,
                  auth: Auth = None, config: Config = None, connection: Type[Connection] = None):
@@ -26,13 +26,14 @@ class Application:
             middleware = [
                 default_error_handler,
             ]
-        self._channels: dict[str, list[Connection]] = defaultdict(list)
+        self._channels: dict[str, dict[int, Connection]] = defaultdict(dict)
 
         api = Api()
         for i in apis:
             api.update(i)
 
         self._handlers = api.compute()
+        self._get_handler = self._handlers.get
         self._runner: Forward = self._run
         if middleware:
             for md in middleware:
@@ -45,7 +46,7 @@ class Application:
         return self._runner(handler)
 
     def get_handlers_by_id(self, handler_id: int) -> list[HandlerItem] | HandlerItem | None:
-        return self._handlers.get(handler_id)
+        return self._get_handler(handler_id)
 
     def get_handler_id(self, handler: Handler) -> int | None:
         return handler.handler_id
@@ -54,17 +55,16 @@ class Application:
         return list(self._channels.keys())
 
     def channel(self, name: str) -> Iterable[Connection]:
-        return iter(self._channels.get(name, []))
+        if (conns := self._channels.get(name)) is None:
+            return iter(())
+        return iter(conns.values())
 
     def attach_conn_to_channel(self, conn: Connection, channel: str) -> None:
-        if conn not in self._channels[channel]:
-            self._channels[channel].append(conn)
+        self._channels[channel][id(conn)] = conn
 
     def detach_conn_from_channel(self, conn: Connection, channel: str) -> None:
-        try:
-            self._channels[channel].remove(conn)
-        except (KeyError, ValueError):
-            pass
+        if (conns := self._channels.get(channel)) is not None:
+            conns.pop(id(conn), None)
 
     def clear_channel(self, channel: str) -> None:
         self._channels[channel].clear()
@@ -73,5 +73,6 @@ class Application:
         self._channels.clear()
 
     def remove_conn_from_channels(self, conn: Connection) -> None:
-        for channel_name in self.channels():
-            self.detach_conn_from_channel(conn, channel_name)
+        conn_id = id(conn)
+        for conns in self._channels.values():
+            conns.pop(conn_id, None)
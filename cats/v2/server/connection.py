@@ -1,7 +1,6 @@
 import asyncio
 import functools
 from logging import getLogger
-from random import randint
 from time import time_ns
 from typing import Iterable
 
@@ -10,7 +9,6 @@ from tornado.iostream import IOStream
 from cats.errors import ProtocolError
 from cats.identity import Identity, IdentityObject
 from cats.types import BytesAnyGen
-from cats.utils import as_uint
 from cats.v2.action import *
 from cats.v2.auth import AuthError
 from cats.v2.config import Config
@@ -54,9 +52,7 @@ class Connection(BaseConnection):
         return self._app
 
     async def init(self):
-        self.client: ClientStatement = ClientStatement.unpack(
-            await self.read(as_uint(await self.read(4)))
-        )
+        self.client: ClientStatement = ClientStatement.unpack(await self.read_framed())
         self.api_version = self.client.api
         self.set_compressors(self.client.compressors, self.client.default_compression)
         self.debug(f'[RECV {self.address}] {self.client}')
@@ -64,7 +60,7 @@ class Connection(BaseConnection):
         server_stmt = ServerStatement(
             server_time=time_ns() // 1000_000,
         )
-        await self.write(server_stmt.pack())
+        await self.write(server_stmt.pack(), no_delay=True)
         self.debug(f'[SEND {self.address}] {server_stmt}')
 
         if self.conf.handshake is not None:
@@ -72,40 +68,56 @@ class Connection(BaseConnection):
 
         self.debug(f'{self} initialized')
 
+    ACTION_HANDLERS = {
+        InputAction: 'handle_input_action',
+        CancelInputAction: 'handle_cancel_input_action',
+        DownloadSpeedAction: 'handle_download_speed_action',
+        PingAction: 'handle_ping_action',
+        Action: 'handle_action',
+    }
+
     async def handle(self, action: BaseAction):
-        if isinstance(action, InputAction):
-            await action.recv_data()
-            if action.message_id in self.input_pool:
-                self.input_pool[action.message_id].done(action)
-            else:
-                raise ProtocolError('Received answer but input does`t exists', conn=self)
-        elif isinstance(action, CancelInputAction):
-            if action.message_id in self.input_pool:
-                self.input_pool[action.message_id].cancel()
-            await action.dump_data(0)
-        elif isinstance(action, DownloadSpeedAction):
-            limit = action.speed
-            if not limit or (1024 <= limit <= 33_554_432):
-                self.download_speed = limit
-            else:
-                raise ProtocolError('Unsupported download speed limit', conn=self)
-            await action.dump_data(0)
-        elif isinstance(action, PingAction):
+        if (handler := self.get_action_handler(type(action))) is not None:
+            await getattr(self, handler)(action)
+
+    async def handle_input_action(self, action: InputAction):
+        await action.recv_data()
+        if action.message_id in self.input_pool:
+            self.input_pool[action.message_id].done(action)
+        else:
+            raise ProtocolError('Received answer but input does`t exists', conn=self)
+
+    async def handle_cancel_input_action(self, action: CancelInputAction):
+        if action.message_id in self.input_pool:
+            self.input_pool[action.message_id].cancel()
+        await action.dump_data(0)
+
+    async def handle_download_speed_action(self, action: DownloadSpeedAction):
+        limit = action.speed
+        if not limit or (1024 <= limit <= 33_554_432):
+            self.download_speed = limit
+        else:
+            raise ProtocolError('Unsupported download speed limit', conn=self)
+        await action.dump_data(0)
+
+    async def handle_ping_action(self, action: PingAction):
+        if self.conf.debug:
             self.debug(f'Ping {action.send_time} [-] {action.recv_time}')
-            await action.send(self)
-            await action.dump_data(0)
-        elif isinstance(action, Action):
-            async with self.preserve_message_id(action.message_id):
-                handler = self.dispatch(action.handler_id)
-                result = await self.app.run(handler(action))
-                if result is not None:
-                    if not isinstance(result, Action):
-                        raise ProtocolError('Returned invalid response', conn=self)
-
-                    result.handler_id = action.handler_id
-                    result.message_id = action.message_id
-                    result.offset = action.offset
-                    await result.send(self)
+        await action.send(self)
+        await action.dump_data(0)
+
+    async def handle_action(self, action: Action):
+        async with self.preserve_message_id(action.message_id):
+            handler = self.dispatch(action.handler_id)
+            result = await self.app.run(handler(action))
+            if result is not None:
+                if not isinstance(result, Action):
+                    raise ProtocolError('Returned invalid response', conn=self)
+
+                result.handler_id = action.handler_id
+                result.message_id = action.message_id
+                result.offset = action.offset
+                await result.send(self)
 
     def dispatch(self, handler_id):
         handlers = self.app.get_handlers_by_id(handler_id)
@@ -185,13 +197,23 @@ class Connection(BaseConnection):
         self.reset_idle_timer()
         return res
 
+    async def read_into(self, buffer: bytearray | memoryview, partial: bool = False) -> int:
+        res = await self._stream.read_into(buffer, partial=partial)
+        self.reset_idle_timer()
+        return res
+
     async def read_until(self, delimiter: bytes, max_bytes: int | None) -> bytes:
         res = await self._stream.read_until(delimiter, max_bytes=max_bytes)
         self.reset_idle_timer()
         return res
 
-    async def write(self, data: bytes | bytearray | memoryview) -> None:
-        res = await self._stream.write(data)
+    async def read_framed(self, prefix_len: int = 4) -> bytes:
+        res = await super().read_framed(prefix_len)
+        self.reset_idle_timer()
+        return res
+
+    async def write(self, data: bytes | bytearray | memoryview, no_delay: bool = False) -> None:
+        res = await super().write(data, no_delay)
         self.reset_idle_timer()
         return res
 
@@ -207,9 +229,11 @@ class Connection(BaseConnection):
         )
 
     def get_free_message_id(self) -> int:
+        message_id = self._next_message_id
         while True:
-            message_id = randint(0x8000, 0xFFFF)
+            message_id = ((message_id + 1) & 0x7FFF) | 0x8000
             if message_id not in self._message_pool:
+                self._next_message_id = message_id
                 return message_id
 
     def _close_tasks(self):
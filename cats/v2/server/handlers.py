@@ -147,7 +147,8 @@ class Handler:
                 await asyncio.sleep(self.fix_exec_time - sp - random() / 20)
             elif sp > self.fix_exec_time + 0.2:
                 logging.warning(f'{type(self).__qualname__} run time exceeded fixed: {sp:.3f}/{self.fix_exec_time:.3f}')
-        self.conn.debug(f'[EXEC {self.conn.address}] Handler {type(self).__name__} took {end - st}')
+        if self.conn.conf.debug:
+            self.conn.debug(f'[EXEC {self.conn.address}] Handler {type(self).__name__} took {end - st}')
         return res
 
     async def prepare(self) -> None:
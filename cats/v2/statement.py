@@ -28,8 +28,8 @@ class ClientStatement(Statement):
     api: int
     client_time: int
     scheme_format: Literal['JSON']
-    compressors: list[Literal['gzip', 'zlib']]
-    default_compression: Literal['gzip', 'zlib']
+    compressors: list[Literal['gzip', 'zlib', 'zstd']]
+    default_compression: Literal['gzip', 'zlib', 'zstd']
 
 
 @dataclass
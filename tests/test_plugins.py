@@ -0,0 +1,27 @@
+from collections import OrderedDict
+
+from pytest import mark
+
+from cats.plugins import without_missing
+from cats.types import MISSING
+
+
+class TestWithoutMissing:
+    @mark.parametrize('obj', (
+            None, 1, 1.5, True, 'str', b'bytes',
+            {'a': [1, {'b': None}], 'c': 'd'},
+            [[], {}, [1, [2, [3]]]],
+    ))
+    def test_plain_json_unchanged(self, obj):
+        assert without_missing(obj) == obj
+
+    def test_missing_removed(self):
+        obj = {'a': MISSING, 'b': [1, MISSING, {'c': MISSING, 'd': 2}], 'e': {'f': [MISSING]}}
+        assert without_missing(obj) == {'b': [1, {'d': 2}], 'e': {'f': []}}
+
+    def test_generic_containers(self):
+        obj = OrderedDict(a=(1, MISSING, {2}), b=MISSING)
+        assert without_missing(obj) == {'a': [1, [2]]}
+
+    def test_top_level_missing(self):
+        assert without_missing(MISSING) is None
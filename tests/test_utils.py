@@ -0,0 +1,55 @@
+import io
+import os
+
+from pytest import raises
+
+from cats.utils import copy_bytes, tmp_file
+
+PAYLOAD = os.urandom(100_000)
+
+
+class ShortWriter(io.RawIOBase):
+    """Raw stream that accepts at most `limit` bytes per write() call"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.data = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        b = memoryview(b)[:self.limit]
+        self.data += b
+        return len(b)
+
+
+class TestCopyBytes:
+    def test_file_to_file(self):
+        src, dst = tmp_file(), tmp_file()
+        try:
+            src.write_bytes(PAYLOAD)
+            with src.open('rb', buffering=0) as rc, dst.open('wb', buffering=0) as wc:
+                wc.write(b'head')
+                copy_bytes(rc, wc, 1000, offset=10)
+                assert rc.tell() == 0
+                copy_bytes(rc, wc, 500)
+                assert rc.tell() == 500
+            assert dst.read_bytes() == b'head' + PAYLOAD[10:1010] + PAYLOAD[:500]
+        finally:
+            src.unlink()
+            dst.unlink()
+
+    def test_buffer_fallback(self):
+        src, dst = io.BytesIO(PAYLOAD), io.BytesIO()
+        copy_bytes(src, dst, len(PAYLOAD) - 7, offset=7)
+        assert dst.getvalue() == PAYLOAD[7:]
+
+    def test_short_writes(self):
+        dst = ShortWriter(1000)
+        copy_bytes(io.BytesIO(PAYLOAD), dst, len(PAYLOAD))
+        assert dst.data == PAYLOAD
+
+    def test_unexpected_end(self):
+        with raises(ValueError):
+            copy_bytes(io.BytesIO(b'short'), io.BytesIO(), 10)
@@ -0,0 +1,44 @@
+import os
+from time import time_ns
+
+from pytest import mark
+
+from cats.v2 import Action, PingAction
+from cats.v2.action import MAX_CHUNK_READ
+
+
+class ChunkRecorder:
+    """Stands in for a connection, feeding a payload into read_into() and recording each call"""
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+        self.reads = []
+
+    async def read_into(self, buffer, partial: bool = False) -> int:
+        start = sum(self.reads)
+        buffer[:] = self.payload[start:start + len(buffer)]
+        self.reads.append(len(buffer))
+        return len(buffer)
+
+
+class TestRecvBuffer:
+    @mark.parametrize('size', (0, 1, MAX_CHUNK_READ, MAX_CHUNK_READ + 1, 3 * MAX_CHUNK_READ + 17))
+    @mark.asyncio
+    async def test_reads_in_bounded_chunks(self, size):
+        payload = os.urandom(size)
+        action = Action()
+        action.conn = conn = ChunkRecorder(payload)
+
+        assert await action._recv_buffer(size) == payload
+        assert all(0 < i <= MAX_CHUNK_READ for i in conn.reads)
+        assert len(conn.reads) == -(-size // MAX_CHUNK_READ)
+
+
+class TestTimestamps:
+    @mark.asyncio
+    async def test_wall_clock_ms(self):
+        before = time_ns() // 1000_000
+        action, ping = Action(), PingAction()
+        after = time_ns() // 1000_000
+        assert before <= action.send_time <= after
+        assert before <= ping.recv_time == ping.send_time <= after
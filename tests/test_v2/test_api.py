@@ -8,6 +8,7 @@ from tornado.iostream import StreamClosedError
 from cats import tmp_file
 from cats.v2 import Action, FileInfo, InputAction, StreamAction
 from cats.v2.client import Connection
+from cats.v2.compression import C_GZIP, C_NONE, C_ZLIB
 from .handlers import *
 
 
@@ -158,3 +159,57 @@ async def test_cancel_input(cats_conn: Connection):
     response = await response.cancel()
     assert isinstance(response, Action)
     assert response.status == 500, response.data
+
+
+@mark.asyncio
+async def test_unsubscribe(cats_conn: Connection):
+    def handler(_):
+        pass
+
+    sub_id = cats_conn.subscribe(0xFFFF, handler)
+    cats_conn.subscribe(0xFFFF, handler)
+    cats_conn.unsubscribe(0xFFFF, sub_id)
+    assert list(cats_conn.subscriptions[0xFFFF].values()) == [handler]
+    cats_conn.unsubscribe(0xFFFF, handler)
+    assert not cats_conn.subscriptions[0xFFFF]
+
+
+@mark.asyncio
+async def test_client_sends_only_shared_compressors(cats_conn: Connection):
+    # Peer support for zstd is unknown, so the client must never pick it for outgoing payloads
+    assert cats_conn.allowed_compressors == {C_NONE, C_GZIP, C_ZLIB}
+    assert cats_conn.default_compressor == C_ZLIB
+
+
+@mark.asyncio
+async def test_echo_handler_multi_chunk(cats_conn: Connection):
+    payload = os.urandom(3 * (1 << 20) + 5)
+    response = await cats_conn.send(EchoHandler.handler_id, payload)
+    assert response.data == payload
+
+
+@mark.asyncio
+async def test_notify_subscribers(cats_conn: Connection):
+    received = []
+
+    def sync_handler(action):
+        received.append(('sync', action.data))
+
+    async def async_handler(action):
+        received.append(('async', action.data))
+
+    cats_conn.subscribe(0xFFFE, sync_handler)
+    await cats_conn.notify_subscribers(Action(b'1', handler_id=0xFFFE))
+    # Subscriptions edited directly are picked up once the cache is invalidated
+    cats_conn.subscriptions[0xFFFE][-1] = async_handler
+    await cats_conn.notify_subscribers(Action(b'2', handler_id=0xFFFE))
+    cats_conn.invalidate_subscribers(0xFFFE)
+    await cats_conn.notify_subscribers(Action(b'3', handler_id=0xFFFE))
+    cats_conn.subscriptions[0xFFFE].clear()
+    cats_conn.invalidate_subscribers()
+    await cats_conn.notify_subscribers(Action(b'4', handler_id=0xFFFE))
+    sub_id = cats_conn.subscribe(0xFFFE, async_handler)
+    await cats_conn.notify_subscribers(Action(b'5', handler_id=0xFFFE))
+    cats_conn.unsubscribe(0xFFFE, sub_id)
+    await cats_conn.notify_subscribers(Action(b'6', handler_id=0xFFFE))
+    assert received == [('sync', b'1'), ('sync', b'2'), ('sync', b'3'), ('async', b'3'), ('async', b'5')]
@@ -1,6 +1,13 @@
+import copy
+import gc
+import math
+import os
+import pickle
+
 from pytest import mark
 
-from cats.v2 import ByteCodec
+from cats import tmp_file
+from cats.v2 import ByteCodec, Codec, FileCodec, FileInfo, Files, JsonCodec, T_BYTE, T_JSON
 
 
 class TestBytesCodec:
@@ -16,3 +23,133 @@ class TestBytesCodec:
     @mark.asyncio
     async def test_decode_success(self):
         assert await ByteCodec.decode(b'Hello', {}) == b'Hello'
+
+
+class TestJsonCodec:
+    @mark.asyncio
+    async def test_encode_signed_zero(self):
+        assert await JsonCodec.encode(0.0, {}) != await JsonCodec.encode(-0.0, {})
+        assert math.copysign(1, await JsonCodec.decode(await JsonCodec.encode(-0.0, {}), {})) == -1
+
+    @mark.asyncio
+    async def test_encode_offset(self):
+        assert await JsonCodec.encode({'a': 1}, {}, offset=2) == b'a":1}'
+
+
+class TestCodec:
+    @mark.parametrize('inp, type_id', (
+            (None, T_BYTE),
+            (b'Hello', T_BYTE),
+            (memoryview(b'Hello'), T_BYTE),
+            ('Hello', T_JSON),
+            (True, T_JSON),
+            ({'a': 1}, T_JSON),
+            ([1, 2], T_JSON),
+    ))
+    @mark.asyncio
+    async def test_encode_type(self, inp, type_id):
+        _, res = await Codec.encode(inp, {})
+        assert res == type_id
+
+    @mark.asyncio
+    async def test_register(self, monkeypatch):
+        class UpperCodec(ByteCodec):
+            type_id = 0xF0
+            type_name = 'upper'
+
+            @classmethod
+            async def decode(cls, data: bytes, headers) -> bytes:
+                return data.upper()
+
+        monkeypatch.setitem(Codec.codecs, UpperCodec.type_id, UpperCodec)
+        monkeypatch.setattr(Codec, 'by_id', list(Codec.by_id))
+        Codec.register(UpperCodec)
+        assert Codec.get_codec_name(UpperCodec.type_id) == 'upper'
+        assert await Codec.decode(b'abc', UpperCodec.type_id, {}) == b'ABC'
+
+    @mark.parametrize('type_id', (0xF1, 0x100))
+    def test_unknown_name(self, type_id):
+        assert Codec.get_codec_name(type_id) == 'unknown'
+
+
+class TestFiles:
+    @staticmethod
+    def make_info(name: str) -> FileInfo:
+        path = tmp_file()
+        path.write_bytes(b'data')
+        return FileInfo(name, path, 4, None)
+
+    def test_unlinks_files_added_after_construction(self):
+        first, later, updated = self.make_info('a'), self.make_info('b'), self.make_info('c')
+        files = Files({'a': first})
+        files['b'] = later
+        files.update(c=updated)
+        del files
+        gc.collect()
+        assert not first.path.exists()
+        assert not later.path.exists()
+        assert not updated.path.exists()
+
+    def test_keeps_files_removed_before_collection(self):
+        kept, popped = self.make_info('a'), self.make_info('b')
+        files = Files({'a': kept, 'b': popped})
+        del files['a']
+        assert files.pop('b') is popped
+        del files
+        gc.collect()
+        assert kept.path.exists() and popped.path.exists()
+        kept.path.unlink()
+        popped.path.unlink()
+
+    @mark.parametrize('clone', (
+            copy.copy,
+            copy.deepcopy,
+            lambda files: pickle.loads(pickle.dumps(files)),
+    ))
+    def test_clone_has_own_mirror(self, clone):
+        first, added, removed = self.make_info('a'), self.make_info('b'), self.make_info('c')
+        files = Files({'a': first, 'c': removed})
+        cloned = clone(files)
+        assert type(cloned) is Files and cloned == files
+        # Edits of the clone must not change which files the original cleans up
+        cloned['b'] = added
+        del cloned['c']
+        assert files._paths == {'a': first.path.as_posix(), 'c': removed.path.as_posix()}
+        del files
+        gc.collect()
+        assert not first.path.exists() and not removed.path.exists()
+        assert added.path.exists()
+        del cloned
+        gc.collect()
+        assert not added.path.exists()
+
+
+class TestFileCodec:
+    @staticmethod
+    def make_info(name: str, size: int) -> FileInfo:
+        path = tmp_file()
+        path.write_bytes(os.urandom(size))
+        return FileInfo(name, path, size, None)
+
+    @mark.parametrize('offset', (0, 10))
+    @mark.asyncio
+    async def test_encode_concurrent(self, offset):
+        # Sizes cross the copy buffer size, so parts are copied concurrently in several chunks
+        sources = {
+            'big': self.make_info('big.bin', 3 * (1 << 20) + 17),
+            'empty': self.make_info('empty.bin', 0),
+            'small': self.make_info('small.bin', 100),
+            'mid': self.make_info('mid.bin', (1 << 20) + 1),
+        }
+        expected = b''.join(i.path.read_bytes() for i in sources.values())[offset:]
+        headers = {}
+        encoded = await FileCodec.encode(dict(sources), headers, offset)
+        try:
+            assert encoded.read_bytes() == expected
+            files = await FileCodec.decode(encoded, headers)
+            assert b''.join(i.path.read_bytes() for i in files.values()) == expected
+            assert sum(i['size'] for i in headers['Files']) == len(expected)
+        finally:
+            encoded.unlink()
+            for info in sources.values():
+                info.path.unlink()
@@ -1 +1,198 @@
-# FIXME: Cover compression
+import os
+import zlib as std_zlib
+
+from pytest import mark, raises
+
+from cats import tmp_file
+from cats.errors import CompressorError
+from cats.utils import as_uint
+from cats.v2.compression import (
+    C_GZIP, C_NONE, C_ZLIB, C_ZSTD, Compressor, DummyCompressor, ENTROPY_SAMPLE, GzipCompressor, LEVEL,
+    MIN_COMPRESS_SIZE, ZlibCompressor, ZstdCompressor, zlib, zstandard,
+)
+from cats.v2.connection import Connection
+
+PAYLOAD = b'CATS compression payload ' * 1024
+
+
+class TestDeflate:
+    def test_fastest_level(self):
+        # Either backend (stdlib zlib or ISA-L) must pick its fastest level
+        assert LEVEL == getattr(zlib, 'ISAL_BEST_SPEED', getattr(zlib, 'Z_BEST_SPEED', None))
+
+    @mark.parametrize('compressor', (GzipCompressor, ZlibCompressor))
+    @mark.asyncio
+    async def test_roundtrip(self, compressor):
+        headers = {}
+        buff = await compressor.compress(PAYLOAD, headers)
+        assert len(buff) < len(PAYLOAD)
+        assert await compressor.decompress(buff, headers) == PAYLOAD
+
+    @mark.parametrize('compression', (C_GZIP, C_ZLIB))
+    @mark.asyncio
+    async def test_stdlib_interop(self, compression):
+        # Accelerated backend must stay wire compatible with peers using plain gzip/zlib
+        import gzip as std_gzip
+
+        buff, _ = await Compressor.compress(PAYLOAD, {}, {compression}, compression, compression)
+        if compression == C_GZIP:
+            assert std_gzip.decompress(buff) == PAYLOAD
+        else:
+            assert std_zlib.decompress(buff[4:]) == PAYLOAD
+
+
+class TestZlibChecksum:
+    @mark.asyncio
+    async def test_adler32_from_trailer(self):
+        headers = {}
+        buff = await ZlibCompressor.compress(PAYLOAD, headers)
+        assert headers['Adler32'] == std_zlib.adler32(PAYLOAD)
+        assert await ZlibCompressor.decompress(buff, headers) == PAYLOAD
+
+    @mark.asyncio
+    async def test_checksum_mismatch(self):
+        headers = {}
+        buff = await ZlibCompressor.compress(PAYLOAD, headers)
+        headers['Adler32'] ^= 1
+        with raises(CompressorError):
+            await ZlibCompressor.decompress(buff, headers)
+
+    @mark.asyncio
+    async def test_truncated(self):
+        headers = {}
+        buff = await ZlibCompressor.compress(PAYLOAD, headers)
+        with raises(CompressorError):
+            await ZlibCompressor.decompress(buff[:-10], headers)
+
+    @mark.asyncio
+    async def test_file(self):
+        src, packed, dst = tmp_file(), tmp_file(), tmp_file()
+        try:
+            src.write_bytes(PAYLOAD)
+            headers = {}
+            await ZlibCompressor.compress_file(src, packed, headers)
+            assert headers['Adler32'] == std_zlib.adler32(PAYLOAD)
+            packed_data = packed.read_bytes()
+            assert as_uint(packed_data[:4]) == len(PAYLOAD)
+            assert std_zlib.decompress(packed_data[4:]) == PAYLOAD
+            await ZlibCompressor.decompress_file(packed, dst, headers)
+            assert dst.read_bytes() == PAYLOAD
+
+            headers['Adler32'] ^= 1
+            with raises(CompressorError):
+                await ZlibCompressor.decompress_file(packed, dst, headers)
+            assert not dst.exists()
+        finally:
+            for path in (src, packed, dst):
+                path.unlink(missing_ok=True)
+
+
+class TestZstd:
+    def test_registered_if_installed(self):
+        assert ('zstd' in Compressor.codes) is (zstandard is not None)
+        assert (Compressor.by_id[C_ZSTD] is ZstdCompressor) is (zstandard is not None)
+
+    @mark.skipif(zstandard is None, reason='zstandard is not installed')
+    @mark.asyncio
+    async def test_roundtrip(self):
+        buff, compression = await Compressor.compress(PAYLOAD, {}, {C_ZSTD}, C_ZSTD)
+        assert compression == C_ZSTD and len(buff) < len(PAYLOAD)
+        assert await Compressor.decompress(buff, {}, C_ZSTD) == PAYLOAD
+
+    @mark.skipif(zstandard is None, reason='zstandard is not installed')
+    @mark.asyncio
+    async def test_file_roundtrip(self):
+        src, packed, dst = tmp_file(), tmp_file(), tmp_file()
+        try:
+            src.write_bytes(PAYLOAD)
+            assert await Compressor.compress_file(src, packed, {}, {C_ZSTD}, C_ZSTD) == C_ZSTD
+            await Compressor.decompress_file(packed, dst, {}, C_ZSTD)
+            assert dst.read_bytes() == PAYLOAD
+        finally:
+            for path in (src, packed, dst):
+                path.unlink(missing_ok=True)
+
+    @mark.skipif(zstandard is None, reason='zstandard is not installed')
+    @mark.asyncio
+    async def test_broken(self):
+        with raises(CompressorError):
+            await Compressor.decompress(b'not a zstd frame', {}, C_ZSTD)
+
+    @mark.asyncio
+    async def test_unavailable_default_falls_back(self, cats_config):
+        conn = Connection(cats_config)
+        conn.set_compressors(['gzip', 'zlib', 'zstd'], 'zstd')
+        assert conn.default_compressor == (C_ZLIB if zstandard is None else C_ZSTD)
+
+
+class ReversedCompressor(DummyCompressor):
+    type_id = 0xF0
+    type_name = 'Reversed'
+
+    @classmethod
+    async def compress(cls, data: bytes, headers) -> bytes:
+        return data[::-1]
+
+
+class TestRegister:
+    @mark.asyncio
+    async def test_runtime_registered(self, monkeypatch):
+        monkeypatch.setitem(Compressor.codes, 'reversed', ReversedCompressor.type_id)
+        monkeypatch.setitem(Compressor.compressors, ReversedCompressor.type_id, ReversedCompressor)
+        monkeypatch.setattr(Compressor, 'by_id', list(Compressor.by_id))
+        Compressor.register(ReversedCompressor)
+        assert Compressor.get_compressor_name(ReversedCompressor.type_id) == 'Reversed'
+        assert await Compressor.compress(
+            b'abc', {}, {ReversedCompressor.type_id}, C_NONE, ReversedCompressor.type_id
+        ) == (b'cba', ReversedCompressor.type_id)
+
+    @mark.parametrize('compression', (0xF1, 0x100))
+    @mark.asyncio
+    async def test_unknown(self, compression):
+        with raises(CompressorError):
+            await Compressor.compress(b'abc', {}, {compression}, C_NONE, compression)
+        path = tmp_file()
+        try:
+            with raises(CompressorError):
+                await Compressor.compress_file(path, path, {}, {compression}, C_NONE, compression)
+        finally:
+            path.unlink(missing_ok=True)
+
+
+class TestProposeCompression:
+    @mark.parametrize('buff, res', (
+            (bytes(MIN_COMPRESS_SIZE), C_NONE),
+            (bytes(MIN_COMPRESS_SIZE + 1), C_ZLIB),
+            (os.urandom(MIN_COMPRESS_SIZE + 1), C_NONE),
+            (os.urandom(ENTROPY_SAMPLE), C_NONE),
+            (bytes(ENTROPY_SAMPLE), C_ZLIB),
+            # Only the leading sample is inspected
+            (bytes(ENTROPY_SAMPLE) + os.urandom(ENTROPY_SAMPLE), C_ZLIB),
+            (os.urandom(ENTROPY_SAMPLE) + bytes(ENTROPY_SAMPLE), C_NONE),
+    ))
+    @mark.asyncio
+    async def test_buffer(self, buff, res):
+        assert await Compressor.propose_compression(buff, {}, C_ZLIB) == res
+
+    @mark.parametrize('buff, res', (
+            (bytes(MIN_COMPRESS_SIZE), C_NONE),
+            (bytes(ENTROPY_SAMPLE * 2), C_ZLIB),
+            (os.urandom(ENTROPY_SAMPLE * 2), C_NONE),
+    ))
+    @mark.asyncio
+    async def test_file(self, buff, res):
+        path = tmp_file()
+        try:
+            path.write_bytes(buff)
+            assert await Compressor.propose_compression(path, {}, C_ZLIB) == res
+        finally:
+            path.unlink()
+
+    @mark.asyncio
+    async def test_default_none(self):
+        assert await Compressor.propose_compression(bytes(ENTROPY_SAMPLE), {}, C_NONE) == C_NONE
+
+    @mark.asyncio
+    async def test_incompressible_sent_as_is(self):
+        payload = os.urandom(ENTROPY_SAMPLE)
+        assert await Compressor.compress(payload, {}, {C_NONE, C_ZLIB}, C_ZLIB) == (payload, C_NONE)
@@ -0,0 +1,177 @@
+import asyncio
+import gc
+
+from pytest import mark, raises
+from tornado.iostream import StreamClosedError
+
+from cats.v2 import Config
+from cats.v2.client import Connection as ClientConnection
+from cats.v2.connection import Connection, WRITE_COALESCE
+from cats.v2.server import Connection as ServerConnection
+
+
+class RecordingStream:
+    """Stands in for IOStream: keeps every write, resolves its future right away or fails it with next error"""
+
+    def __init__(self, *errors: Exception | None):
+        self.writes: list[bytes] = []
+        self.errors = list(errors)
+
+    def write(self, data) -> asyncio.Future:
+        self.writes.append(bytes(data))
+        future = asyncio.get_running_loop().create_future()
+        if self.errors and (error := self.errors.pop(0)) is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(None)
+        return future
+
+    def closed(self) -> bool:
+        return False
+
+    def close(self, exc=None) -> None:
+        pass
+
+
+class StreamConnection(Connection):
+    __slots__ = ('_stream',)
+
+    def __init__(self, stream: RecordingStream):
+        super().__init__(Config())
+        self._stream = stream
+
+
+LARGE = b'L' * WRITE_COALESCE
+
+
+class TestWriteCoalescing:
+    @mark.asyncio
+    async def test_small_writes_coalesced(self):
+        conn = StreamConnection(stream := RecordingStream())
+        await asyncio.gather(conn.write(b'a'), conn.write(b'b'), conn.write(b'c'))
+        assert stream.writes == [b'abc']
+
+    @mark.asyncio
+    async def test_order_buffered_then_unbuffered(self):
+        conn = StreamConnection(stream := RecordingStream())
+        buffered = asyncio.ensure_future(conn.write(b'a'))
+        await asyncio.sleep(0)
+        assert stream.writes == []
+        await conn.write(b'b', no_delay=True)
+        await conn.write(LARGE)
+        await buffered
+        assert stream.writes == [b'a', b'b', LARGE]
+
+    @mark.asyncio
+    async def test_cancel_one_writer(self):
+        conn = StreamConnection(stream := RecordingStream())
+        cancelled = asyncio.ensure_future(conn.write(b'a'))
+        kept = asyncio.ensure_future(conn.write(b'b'))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await kept
+        assert cancelled.cancelled()
+        # Cancelling a writer doesn't take back its data, nor fails the writers sharing the flush
+        assert stream.writes == [b'ab']
+
+    @mark.asyncio
+    async def test_error_reaches_every_writer(self):
+        conn = StreamConnection(RecordingStream(StreamClosedError()))
+        results = await asyncio.gather(conn.write(b'a'), conn.write(b'b'), return_exceptions=True)
+        assert len(results) == 2 and all(isinstance(i, StreamClosedError) for i in results)
+
+
+class TestWriteMany:
+    @mark.asyncio
+    async def test_empty(self):
+        conn = StreamConnection(stream := RecordingStream())
+        await conn.write_many(())
+        assert stream.writes == []
+
+    @mark.asyncio
+    async def test_small_chunks_coalesced(self):
+        conn = StreamConnection(stream := RecordingStream())
+        await conn.write_many((b'head', b'', b'body'))
+        assert stream.writes == [b'headbody']
+
+    @mark.asyncio
+    async def test_order_with_large_chunk(self):
+        conn = StreamConnection(stream := RecordingStream())
+        await conn.write_many((b'a', LARGE, b'b'))
+        assert stream.writes == [b'a', LARGE, b'b']
+
+    @mark.asyncio
+    async def test_large_chunk_error_raised(self):
+        conn = StreamConnection(RecordingStream(StreamClosedError(), StreamClosedError()))
+        with raises(StreamClosedError):
+            await conn.write_many((LARGE, LARGE))
+
+    @mark.asyncio
+    async def test_head_error_raised(self):
+        conn = StreamConnection(RecordingStream(StreamClosedError(), None))
+        with raises(StreamClosedError):
+            await conn.write_many((LARGE, b'tail'))
+
+    @mark.asyncio
+    async def test_buffered_head_error_retrieved(self):
+        loop = asyncio.get_running_loop()
+        reported = []
+        handler = loop.get_exception_handler()
+        loop.set_exception_handler(lambda _, context: reported.append(context))
+        try:
+            conn = StreamConnection(RecordingStream(StreamClosedError(), StreamClosedError()))
+            with raises(StreamClosedError):
+                await conn.write_many((b'a', LARGE))
+            for _ in range(3):
+                await asyncio.sleep(0)
+            gc.collect()
+        finally:
+            loop.set_exception_handler(handler)
+        assert reported == []
+
+
+class TestPreserveMessageId:
+    @mark.asyncio
+    async def test_same_id_waits(self):
+        conn = StreamConnection(RecordingStream())
+        events = []
+
+        async def hold(name: str, message_id: int):
+            async with conn.preserve_message_id(message_id):
+                events.append(f'{name} in')
+                await asyncio.sleep(0.01)
+                events.append(f'{name} out')
+
+        await asyncio.gather(hold('a', 1), hold('b', 1), hold('c', 2))
+        assert events.index('b in') > events.index('a out')
+        assert events.index('c in') < events.index('a out')
+        assert conn._message_pool == {}
+
+    @mark.asyncio
+    async def test_released_on_error(self):
+        conn = StreamConnection(RecordingStream())
+        with raises(ValueError):
+            async with conn.preserve_message_id(1):
+                raise ValueError
+        await asyncio.wait_for(conn.preserve_message_id(1).__aenter__(), 0.1)
+
+
+class TestMessageIdRing:
+    @mark.asyncio
+    async def test_client_ids(self):
+        conn = ClientConnection(Config(), 1)
+        assert [conn.get_free_message_id() for _ in range(3)] == [1, 2, 3]
+        conn._message_pool[4] = asyncio.Event()
+        conn._recv_pool[5] = asyncio.get_running_loop().create_future()
+        assert conn.get_free_message_id() == 6
+        conn._next_message_id = 0x7FFE
+        assert [conn.get_free_message_id() for _ in range(3)] == [0x7FFF, 0, 1]
+
+    @mark.asyncio
+    async def test_server_ids(self):
+        conn = ServerConnection(RecordingStream(), ('127.0.0.1', 0), 2, Config(), None)
+        assert [conn.get_free_message_id() for _ in range(2)] == [0x8001, 0x8002]
+        conn._message_pool[0x8003] = asyncio.Event()
+        assert conn.get_free_message_id() == 0x8004
+        conn._next_message_id = 0xFFFE
+        assert [conn.get_free_message_id() for _ in range(3)] == [0xFFFF, 0x8000, 0x8001]
@@ -0,0 +1,90 @@
+import asyncio
+import hashlib
+from time import time
+
+from pytest import mark, raises
+
+from cats.errors import HandshakeError
+from cats.v2 import SHA256TimeHandshake
+
+
+class HandshakeConn:
+    """Stands in for a connection: replays the received handshake, keeps the reply"""
+    address = ('127.0.0.1', 0)
+
+    def __init__(self, handshake: bytes):
+        self.handshake = handshake
+        self.written = []
+
+    async def read(self, num_bytes: int) -> bytes:
+        return self.handshake[:num_bytes]
+
+    async def write(self, data: bytes, no_delay: bool = False) -> None:
+        self.written.append(data)
+
+    def debug(self, msg: str) -> None:
+        pass
+
+
+class TestSHA256TimeHandshake:
+    def test_digests(self):
+        handshake = SHA256TimeHandshake(b'secret_key', 2)
+        assert handshake.get_hashes(1234.0) == tuple(
+            hashlib.sha256(b'secret_key' + str(ts).encode('utf-8')).digest()
+            for ts in (1210, 1220, 1230, 1240, 1250)
+        )
+
+    def test_cached_per_bucket(self):
+        handshake = SHA256TimeHandshake(b'secret_key', 1)
+        hashes = handshake.get_hashes(1234.0)
+        assert handshake.get_hashes(1231.0) is hashes
+        assert handshake.get_hashes(1236.0) is not hashes
+
+    def test_cache_bounded(self):
+        handshake = SHA256TimeHandshake(b'secret_key', 1)
+        for i in range(handshake.CACHE_SIZE + 3):
+            handshake.get_hashes(i * 10.0)
+        assert len(handshake._cache) == handshake.CACHE_SIZE
+        # Oldest buckets are evicted first
+        assert min(handshake._cache) == 30
+
+    @mark.parametrize('shift', (-1, 0, 1))
+    @mark.asyncio
+    async def test_validate_accepts_window(self, shift):
+        handshake = SHA256TimeHandshake(b'secret_key', 1)
+        conn = HandshakeConn(handshake.get_hashes(time())[1 + shift])
+        await handshake.validate(conn)
+        assert conn.written == [b'\x01']
+
+    @mark.parametrize('digest', (
+            hashlib.sha256(b'wrong_key').digest(),
+            bytes(32),
+            b'short',
+    ))
+    @mark.asyncio
+    async def test_validate_rejects(self, digest):
+        handshake = SHA256TimeHandshake(b'secret_key', 1)
+        conn = HandshakeConn(digest)
+        with raises(HandshakeError):
+            await handshake.validate(conn)
+        assert conn.written == [b'\x00']
+
+    @mark.asyncio
+    async def test_warmup_next_bucket(self):
+        handshake = SHA256TimeHandshake(b'secret_key', 1)
+        # Within WARMUP_LEAD of the bucket edge (1235) the next bucket is computed right away, off the caller
+        handshake._schedule_warmup(1234.5)
+        assert 1240 not in handshake._cache
+        await asyncio.sleep(0.01)
+        assert handshake._cache[1240] == handshake._hashes_for_bucket(1240)
+
+    @mark.asyncio
+    async def test_warmup_scheduled_once(self, monkeypatch):
+        handshake = SHA256TimeHandshake(b'secret_key', 1)
+        scheduled = []
+        monkeypatch.setattr(asyncio.get_running_loop(), 'call_later', lambda *args: scheduled.append(args))
+        handshake._schedule_warmup(1231.0)
+        handshake._schedule_warmup(1232.0)
+        assert len(scheduled) == 1
+        delay, fn, ts = scheduled[0]
+        assert ts == 1240 and delay == 1235 - handshake.WARMUP_LEAD - 1231.0
@@ -0,0 +1,69 @@
+from pytest import mark, raises
+
+from cats.types import Headers, _normalize_header_key
+
+
+class TestHeadersCodec:
+    @mark.parametrize('headers, res', (
+            ({'a': {1: 2}}, b'{"A":{"1":2}}'),
+            ({'path': '/tmp/ü'}, '{"Path":"/tmp/ü"}'.encode('utf-8')),
+    ))
+    def test_encode(self, headers, res):
+        assert Headers(headers).encode() == res
+
+    def test_decode_malformed(self):
+        assert Headers.decode(b'\xff{') == {}
+
+    def test_empty(self, monkeypatch):
+        # Empty headers never reach the JSON encoder/parser
+        monkeypatch.setattr('cats.types._dumps', None)
+        monkeypatch.setattr('cats.types._loads', None)
+        assert Headers().encode() == b'{}'
+        for buff in (b'', b'{}'):
+            headers = Headers.decode(buff)
+            assert isinstance(headers, Headers) and not headers
+
+
+class TestHeadersKeys:
+    @mark.parametrize('key, res', (
+            ('offset', 'Offset'),
+            ('content type', 'Content-Type'),
+            ('X-REQUEST-ID', 'X-Request-Id'),
+    ))
+    def test_normalized(self, key, res):
+        headers = Headers({key: 1})
+        assert list(headers) == [res]
+        assert headers[key] == headers[res] == 1
+        assert key in headers and res in headers
+
+    def test_normalization_cached(self):
+        _normalize_header_key('cached key')
+        hits = _normalize_header_key.cache_info().hits
+        assert _normalize_header_key('cached key') == 'Cached-Key'
+        assert _normalize_header_key.cache_info().hits == hits + 1
+
+    @mark.parametrize('args, kwargs', (
+            (({'content type': 1, 5: 'ignored'},), {}),
+            (([('content type', 1)],), {}),
+            ((), {'content_type': 1}),
+    ))
+    def test_convert_sources(self, args, kwargs):
+        headers = Headers(*args, **kwargs)
+        assert len(headers) == 1 and next(iter(headers.values())) == 1
+
+    def test_source_untouched(self):
+        src = {'content type': 1}
+        headers = Headers(src)
+        headers['content type'] = 2
+        assert src == {'content type': 1}
+
+    def test_canonical_lookup_skips_normalization(self):
+        headers = Headers({'Content-Type': 1})
+        misses = _normalize_header_key.cache_info().misses
+        hits = _normalize_header_key.cache_info().hits
+        assert headers['Content-Type'] == 1
+        assert _normalize_header_key.cache_info()[:2] == (hits, misses)
+
+    def test_missing_key(self):
+        with raises(KeyError):
+            Headers({'a': 1})['b']